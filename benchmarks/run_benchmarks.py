@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the documents, highlighters and rendering of pte.
+
+Every benchmark runs on synthetic Python files of increasing size, which are generated once and
+kept in the data directory. For each benchmark and size, the time per operation is reported,
+together with the scaling exponent k between consecutive sizes (time ~ size^k, so 0 means
+constant and 1 means linear time). Results can be saved as JSON, which records the commit, and
+compared with the results of another commit.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--max-size 16M] [--only REGEX] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+from dataclasses import dataclass
+import json
+import math
+from pathlib import Path
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Iterator
+
+from pte.documents import Document, DocumentBuffer, DocumentBufferManager
+from pte.syntax_highlighting import PygmentsHighlighter
+from pte.syntax_highlighting.regex_highlighter import RegexHighlighter
+from pte.view import VirtualScreen
+from pte.view.document_view import DocumentView
+
+
+SIZES = {"1K": 1 << 10, "64K": 1 << 16, "1M": 1 << 20, "16M": 1 << 24, "256M": 1 << 28, "1G": 1 << 30}
+DEFAULT_MAX_SIZE = "16M"
+DEFAULT_DATA_DIRECTORY = Path(tempfile.gettempdir()) / "pte-benchmarks"
+
+# minimum duration of a batch of calls, and the total time budget per benchmark and size
+MIN_BATCH_TIME = 0.02
+TIME_BUDGET = 1.0
+REPEATS = 5
+
+WINDOW_HEIGHT = 50
+WINDOW_WIDTH = 120
+
+# a benchmark prepares its subject from the path of a synthetic file, and returns the operation to time
+Benchmark = Callable[[Path], Callable[[], object]]
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(fn: Benchmark) -> Benchmark:
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def load(path: Path) -> DocumentBufferManager:
+    manager = DocumentBufferManager()
+    manager.load_file(path)
+    manager.wait_for_loads()
+    return manager
+
+
+def load_document(path: Path) -> Document:
+    document = load(path).active_buffer.document  # type: ignore[union-attr]
+    # build the lazy indices, which otherwise the first timed call would pay for
+    document.get_index(document.number_of_lines() - 1, 0)
+    return document
+
+
+@benchmark
+def document_insert_and_delete(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    line = document.number_of_lines() // 2
+
+    def run() -> None:
+        document.insert(line, 0, "x")
+        document.delete_in_line(line, 0)
+
+    return run
+
+
+@benchmark
+def document_insert_and_delete_line(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    line = document.number_of_lines() // 2
+
+    def run() -> None:
+        document.insert_line(line, "pass")
+        document.delete_line(line)
+
+    return run
+
+
+@benchmark
+def document_split_and_join_lines(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    line = document.number_of_lines() // 2
+
+    def run() -> None:
+        document.split_line(line, 4)
+        document.join_lines(line)
+
+    return run
+
+
+@benchmark
+def document_get_index(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    positions = _spread(document.number_of_lines())
+    return lambda: [document.get_index(line, 0) for line in positions]
+
+
+@benchmark
+def document_get_coordinates(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    end = document.get_index(document.number_of_lines() - 1, 0)
+    indices = _spread(end)
+    return lambda: [document.get_coordinates(index) for index in indices]
+
+
+@benchmark
+def document_replace_literal(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    return lambda: document.replace("no such text", "other text")
+
+
+@benchmark
+def document_replace_regex(path: Path) -> Callable[[], object]:
+    # matches many lines, which the substitution leaves unchanged
+    document = load_document(path)
+    return lambda: document.replace(r"value_(\d+)", r"value_\1")
+
+
+@benchmark
+def pygments_update(path: Path) -> Callable[[], object]:
+    document = load_document(path)
+    highlighter = PygmentsHighlighter(document, "python", background=False)
+    DocumentBuffer(document, highlighter=highlighter)
+    highlighter.prepare(0, WINDOW_HEIGHT)
+
+    def run() -> None:
+        document.insert(WINDOW_HEIGHT // 2, 0, "#")
+        highlighter.prepare(0, WINDOW_HEIGHT)
+        document.delete_in_line(WINDOW_HEIGHT // 2, 0)
+        highlighter.prepare(0, WINDOW_HEIGHT)
+
+    return run
+
+
+@benchmark
+def regex_find_next_match(path: Path) -> Callable[[], object]:
+    # the only match is in the last line, and a new highlighter knows nothing about the other lines
+    manager = load(path)
+    buffer = manager.active_buffer
+    assert buffer is not None
+    buffer.document.insert_line(buffer.document.number_of_lines(), "needle")
+
+    def run() -> None:
+        highlighter = RegexHighlighter(buffer, "needle")
+        highlighter.update()
+        highlighter.find_next_match(timeout=None)
+
+    return run
+
+
+@benchmark
+def load_file(path: Path) -> Callable[[], object]:
+    return lambda: DocumentBufferManager().load_file(path)
+
+
+@benchmark
+def load_file_completely(path: Path) -> Callable[[], object]:
+    return lambda: load(path)
+
+
+@benchmark
+def save_buffer(path: Path) -> Callable[[], object]:
+    manager = load(path)
+    target = path.with_name(f"{path.stem}-saved{path.suffix}")
+
+    def run() -> None:
+        manager.save_buffer(target)
+        manager.wait_for_saves()
+
+    return run
+
+
+@benchmark
+def draw_scrolling(path: Path) -> Callable[[], object]:
+    view, document = _create_view(path)
+    lines = document.number_of_lines()
+
+    def run() -> None:
+        # every screen line changes
+        line, _ = view.cursor
+        view.cursor = ((line + WINDOW_HEIGHT) % lines, 0)
+        view.draw()
+
+    return run
+
+
+@benchmark
+def draw_unchanged(path: Path) -> Callable[[], object]:
+    view, _ = _create_view(path)
+    view.draw()
+    return view.draw
+
+
+def _create_view(path: Path) -> tuple[DocumentView, Document]:
+    document = load_document(path)
+    highlighter = PygmentsHighlighter(document, "python", background=False)
+    screen = VirtualScreen(WINDOW_HEIGHT, WINDOW_WIDTH)
+    view = DocumentView(screen, screen.window)
+    view.document = document
+    view.highlighters = [highlighter]
+    return view, document
+
+
+def _spread(end: int, count: int = 100) -> list[int]:
+    return [end * i // count for i in range(count)]
+
+
+def generate_file(directory: Path, size_name: str) -> Path:
+    """Return a synthetic Python file of the given size, generating it unless it already exists."""
+    path = directory / f"synthetic-{size_name}.py"
+    if path.exists():
+        return path
+    directory.mkdir(parents=True, exist_ok=True)
+    size = SIZES[size_name]
+    temporary_path = path.with_suffix(".tmp")
+    with open(temporary_path, "w") as fp:
+        written = 0
+        for text in _generate_code():
+            fp.write(text)
+            written += len(text)
+            if written >= size:
+                break
+    temporary_path.rename(path)
+    return path
+
+
+def _generate_code() -> Iterator[str]:
+    for i in range(sys.maxsize):
+        yield (
+            f"def function_{i}(value_{i}, other):\n"
+            f'    """Return a value computed from value_{i}."""\n'
+            f"    result = value_{i} * {i % 97} + other  # comment {i}\n"
+            f'    return f"string {{result}} {i}"\n'
+            "\n"
+        )
+
+
+@dataclass
+class Result:
+    benchmark: str
+    size: str
+    seconds: float
+    calls: int
+
+
+def measure(operation: Callable[[], object]) -> tuple[float, int]:
+    """Return the best time per call over several batches, and the total number of calls."""
+    started = time.perf_counter()
+    operation()
+    single = time.perf_counter() - started
+    number = max(1, math.ceil(MIN_BATCH_TIME / max(single, 1e-9)))
+    repeats = max(1, min(REPEATS, int(TIME_BUDGET / max(single * number, 1e-9))))
+
+    best = single
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best, 1 + repeats * number
+
+
+def run(args: argparse.Namespace) -> list[Result]:
+    size_names = list(SIZES)[: list(SIZES).index(args.max_size) + 1]
+    selected = [name for name in BENCHMARKS if re.search(args.only, name)]
+    results = []
+    for name in selected:
+        for size_name in size_names:
+            path = generate_file(args.data_directory, size_name)
+            operation = BENCHMARKS[name](path)
+            seconds, calls = measure(operation)
+            result = Result(name, size_name, seconds, calls)
+            results.append(result)
+            print(f"{name:<34} {size_name:>5} {_format_time(seconds):>12}   ({calls} calls)", flush=True)
+    return results
+
+
+def report(results: list[Result], baseline: dict[tuple[str, str], float]) -> None:
+    print()
+    print(f"{'benchmark':<34} {'size':>5} {'time':>12} {'scaling':>8} {'vs. baseline':>13}")
+    previous: Result | None = None
+    for result in results:
+        scaling = ""
+        if previous is not None and previous.benchmark == result.benchmark and previous.seconds > 0:
+            size_ratio = SIZES[result.size] / SIZES[previous.size]
+            scaling = f"{math.log(max(result.seconds, 1e-12) / previous.seconds, size_ratio):.2f}"
+        comparison = ""
+        if (base := baseline.get((result.benchmark, result.size))) is not None:
+            comparison = f"{result.seconds / base:.2f}x"
+        print(
+            f"{result.benchmark:<34} {result.size:>5} {_format_time(result.seconds):>12} {scaling:>8} {comparison:>13}"
+        )
+        previous = result
+
+
+def save(results: list[Result], path: Path) -> None:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=False).stdout.strip()
+    data = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [vars(result) for result in results],
+    }
+    path.write_text(json.dumps(data, indent=2))
+
+
+def load_baseline(path: Path) -> dict[tuple[str, str], float]:
+    data = json.loads(path.read_text())
+    print(f"Comparing with commit {data['commit'] or 'unknown'}.")
+    return {(result["benchmark"], result["size"]): result["seconds"] for result in data["results"]}
+
+
+def _format_time(seconds: float) -> str:
+    for unit, factor in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return f"{seconds / factor:.3f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-size", choices=SIZES, default=DEFAULT_MAX_SIZE, help="the size of the largest file")
+    parser.add_argument("--only", default="", help="run only the benchmarks matching this regular expression")
+    parser.add_argument("--output", type=Path, help="save the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="compare with results saved by --output")
+    parser.add_argument(
+        "--data-directory", type=Path, default=DEFAULT_DATA_DIRECTORY, help="where to keep the synthetic files"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+    baseline = load_baseline(args.compare) if args.compare else {}
+    results = run(args)
+    report(results, baseline)
+    if args.output:
+        save(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+#! /bin/bash
+python benchmarks/run_benchmarks.py "$@"
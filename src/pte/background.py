@@ -0,0 +1,158 @@
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import threading
+import time
+from typing import Callable, Generic, TypeVar
+
+from pte import wakeup
+
+
+log = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+
+
+class DebouncedWorker(Generic[T]):
+    """Runs the most recently submitted job in a background thread.
+
+    A job only starts once no newer job has been submitted for the debounce delay; jobs superseded
+    in the meantime are never run. Each job is submitted with a version number, which is returned
+    together with its result, so that callers can discard results that are outdated by the time
+    they are picked up. Finished results wake up the main loop. The thread exits when there is
+    nothing left to do.
+    """
+
+    def __init__(self, name: str, debounce: float = 0.0) -> None:
+        self._name = name
+        self._debounce = debounce
+
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._job: tuple[int, Callable[[], T]] | None = None
+        self._submitted_at = 0.0
+        self._result: tuple[int, T] | None = None
+
+    def submit(self, version: int, job: Callable[[], T]) -> None:
+        with self._lock:
+            self._job = (version, job)
+            self._submitted_at = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def take_result(self) -> tuple[int, T] | None:
+        """Return the result of the most recently finished job, if it has not been taken yet."""
+        with self._lock:
+            result, self._result = self._result, None
+        return result
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._job is None:
+                    self._thread = None
+                    return
+                delay = self._submitted_at + self._debounce - time.monotonic()
+                if delay <= 0:
+                    version, job = self._job
+                    self._job = None
+
+            if delay > 0:
+                time.sleep(delay)
+                continue
+
+            try:
+                result = job()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.error("An error occured in background job of %s (version %s).", self._name, version, exc_info=True)
+                continue
+
+            with self._lock:
+                self._result = (version, result)
+            wakeup.notify()
+
+
+class SubprocessJob(Generic[T]):
+    """Runs a function in a forked child process, so that it can be cancelled at any time.
+
+    Unlike a thread, the child neither competes for the GIL with the main thread nor needs to
+    cooperate in being cancelled, which makes it suitable for work that may take arbitrarily long
+    within a single call into C code (such as matching a regular expression). The child works on a
+    copy-on-write copy of the memory of the parent, and sends the result back through a pipe.
+
+    Only the thread forking is copied into the child, so any lock held by another thread at that
+    moment stays locked in the child forever. The function must therefore not use locks other than
+    those reset after forking (like those of MappedFile and of the logging module); the child does
+    not log, and exits without flushing the standard streams.
+    """
+
+    _context = multiprocessing.get_context("fork")
+
+    def __init__(self, name: str, function: Callable[[], T]) -> None:
+        self._name = name
+        self._function = function
+        self._lock = threading.Lock()
+        self._process: multiprocessing.process.BaseProcess | None = None
+        self._cancelled = False
+
+    def run(self, timeout: float | None = None) -> T | None:
+        """Run the function in a child process and wait for its result.
+
+        Returns None if the job was cancelled, timed out, or failed.
+        """
+        receiver, sender = self._context.Pipe(duplex=False)
+        with self._lock:
+            if self._cancelled:
+                return None
+            self._process = self._context.Process(
+                target=_run_in_child, args=(self._function, sender), name=self._name, daemon=True
+            )
+            self._process.start()
+        sender.close()
+
+        try:
+            if not receiver.poll(timeout):
+                log.warning("Cancelled %s, which did not finish within %s seconds.", self._name, timeout)
+                return None
+            result: T | None
+            result, error = receiver.recv()
+            if error is not None:
+                log.error("An error occured in %s: %s", self._name, error)
+            return result
+        except EOFError:
+            # the child was killed
+            return None
+        finally:
+            self._process.kill()
+            self._process.join()
+            receiver.close()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            if self._process is not None:
+                self._process.kill()
+
+
+def _run_in_child(function: Callable[[], T], sender: Connection) -> None:
+    # logging would block on the lock of the queue the logging thread may have held when forking
+    logging.disable()
+    try:
+        try:
+            result = function()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            sender.send((None, repr(exc)))
+        else:
+            sender.send((result, None))
+        sender.close()
+    finally:
+        # rather than returning to multiprocessing, which flushes the standard streams (whose locks
+        # may be held as well) and prints errors, e.g. of sending a result which cannot be pickled
+        os._exit(0)
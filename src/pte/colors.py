@@ -37,3 +37,8 @@ BLACK_ON_BLUE = 29
 BLACK_ON_MAGENTA = 30
 BLACK_ON_CYAN = 31
 BLACK_ON_WHITE = 32
+
+
+def has_background(color: Color) -> bool:
+    """Return whether the color sets the background, which is the only part of it blank cells show."""
+    return color > BRIGHT_WHITE
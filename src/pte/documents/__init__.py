@@ -1,4 +1,5 @@
 from .cursor import Cursor
-from .document import Document
+from .document import Document, DocumentChange
 from .document_buffer import DocumentBuffer
 from .document_buffer_manager import DocumentBufferManager
+from .line_storage import LineStorage, ListLineStorage, RopeLineStorage
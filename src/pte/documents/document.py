@@ -1,8 +1,23 @@
+from dataclasses import dataclass
 from functools import wraps
 import logging
 from pathlib import Path
 import re
-from typing import Callable, Concatenate, Iterator, ParamSpec, TypeVar
+import time
+from typing import (
+    Callable,
+    Concatenate,
+    Iterator,
+    ParamSpec,
+    Pattern,
+    Sequence,
+    TypeVar,
+)
+
+from pte import performance
+
+from .line_storage import LineStorage, create_line_storage
+from .undo_history import LineEdit, Operation, UndoHistory
 
 
 log = logging.getLogger(__name__)
@@ -11,23 +26,81 @@ log = logging.getLogger(__name__)
 T = TypeVar("T")
 P = ParamSpec("P")
 
+# patterns consisting of ordinary and escaped punctuation characters only
+_LITERAL_PATTERN = re.compile(r"(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])*")
+_ESCAPED_CHARACTER = re.compile(r"\\(.)")
+
+
+@dataclass(frozen=True)
+class DocumentChange:
+    """The lines first_line, ..., first_line + len(old_lines) - 1 were replaced by new_lines.
+
+    The version is the version of the document after the change.
+    """
+
+    version: int
+    first_line: int
+    old_lines: Sequence[str]
+    new_lines: Sequence[str]
+
+    @property
+    def old_end(self) -> int:
+        return self.first_line + len(self.old_lines)
+
+    @property
+    def new_end(self) -> int:
+        return self.first_line + len(self.new_lines)
+
+    @property
+    def line_shift(self) -> int:
+        return len(self.new_lines) - len(self.old_lines)
+
 
 def _modifies_document(fn: Callable[Concatenate["Document", P], T]) -> Callable[Concatenate["Document", P], T]:
+    """Notifies the plain subscribers once after the decorated method, if it changed the document.
+
+    The decorated method is expected to report each change via _emit_change. All changes made by a
+    single call form one undo step (unless an undo group is open).
+    """
+
     @wraps(fn)
     def wrapped_fn(self: "Document", *args: P.args, **kwargs: P.kwargs) -> T:
+        version = self.version
         return_value: T = fn(self, *args, **kwargs)
-        for handler in self._subscribers:  # pylint: disable=protected-access
-            handler()
+        self.history.commit()
+        if self.version != version and self._subscribers:  # pylint: disable=protected-access
+            started = time.perf_counter()
+            for handler in self._subscribers:  # pylint: disable=protected-access
+                handler()
+            performance.add("notify", started)
         return return_value
 
     return wrapped_fn
 
 
 class Document:
-    def __init__(self, lines: list[str], path: Path | None = None):
-        self._lines = lines
+    # number of lines read at once by replace()
+    _REPLACE_BLOCK_SIZE = 4096
+
+    def __init__(
+        self,
+        lines: list[str],
+        path: Path | None = None,
+        storage: LineStorage | None = None,
+        undo_budget: int = UndoHistory.DEFAULT_BUDGET,
+    ):
+        self._lines: LineStorage = storage if storage is not None else create_line_storage(lines)
         self.path = path
+        self.history = UndoHistory(undo_budget)
+        self._recording = True
+        self._version = 0
         self._subscribers: list[Callable[[], None]] = []
+        self._change_subscribers: list[Callable[[DocumentChange], None]] = []
+
+    @property
+    def version(self) -> int:
+        """A number increasing with every change to the document."""
+        return self._version
 
     def number_of_lines(self) -> int:
         return len(self._lines)
@@ -42,30 +115,45 @@ class Document:
     def get_line_length(self, line_number: int) -> int:
         return len(self.get_line(line_number))
 
+    def get_lines(self, start: int, stop: int) -> list[str]:
+        return self._lines.get_lines(start, stop)
+
     def __iter__(self) -> Iterator[str]:
         return iter(self._lines)
 
     @_modifies_document
     def insert(self, line_number: int, column_number: int, text: str) -> None:
-        line = self._lines[line_number]
-        line = line[:column_number] + text + line[column_number:]
+        """Insert the text at the given position; text containing newlines is inserted as a single change."""
+        old_line = self._lines[line_number]
+        if "\n" in text:
+            lines = text.split("\n")
+            lines[0] = old_line[:column_number] + lines[0]
+            lines[-1] += old_line[column_number:]
+            self._replace_lines(line_number, line_number + 1, lines)
+            return
+        line = old_line[:column_number] + text + old_line[column_number:]
         self._lines[line_number] = line
+        self._emit_change(line_number, (old_line,), (line,))
 
     @_modifies_document
     def delete_in_line(self, line_number: int, column_number: int, count: int = 1) -> None:
         if column_number < 0:
             return
-        line = self._lines[line_number]
-        line = line[:column_number] + line[column_number + count :]
+        old_line = self._lines[line_number]
+        line = old_line[:column_number] + old_line[column_number + count :]
+        if line == old_line:
+            return
         self._lines[line_number] = line
+        self._emit_change(line_number, (old_line,), (line,))
 
     @_modifies_document
     def split_line(self, line_number: int, column_number: int) -> None:
-        line = self._lines[line_number]
-        new_line = line[column_number:]
-        line = line[:column_number]
+        old_line = self._lines[line_number]
+        new_line = old_line[column_number:]
+        line = old_line[:column_number]
         self._lines[line_number] = line
         self._lines.insert(line_number + 1, new_line)
+        self._emit_change(line_number, (old_line,), (line, new_line))
 
     @_modifies_document
     def join_lines(self, first_line_number: int) -> None:
@@ -84,40 +172,147 @@ class Document:
 
         self._lines[first_line_number] = first_line + second_line
         del self._lines[first_line_number + 1]
+        self._emit_change(first_line_number, (first_line, second_line), (first_line + second_line,))
 
     @_modifies_document
     def insert_line(self, line_number: int, text: str = "") -> None:
+        line_number = min(line_number, len(self._lines))
         self._lines.insert(line_number, text)
-        log.debug(f"Inserting line {line_number}.")
+        log.debug("Inserting line %d.", line_number)
+        self._emit_change(line_number, (), (text,))
 
     @_modifies_document
     def delete_line(self, line_number: int) -> None:
         if line_number < 0 or line_number >= len(self._lines):
-            log.warning(f"Cannot delete line {line_number}.")
+            log.warning("Cannot delete line %d.", line_number)
             return
+        old_line = self._lines[line_number]
         del self._lines[line_number]
+        self._emit_change(line_number, (old_line,), ())
 
     @_modifies_document
-    def replace(self, pattern: str, substitute: str) -> None:
+    def replace_lines(self, first_line: int, end_line: int, lines: Sequence[str]) -> None:
+        """Replace the lines first_line, ..., end_line - 1 by the given lines."""
+        self._replace_lines(first_line, end_line, lines)
+
+    def _replace_lines(self, first_line: int, end_line: int, lines: Sequence[str]) -> None:
+        old_lines = self._lines.get_lines(first_line, end_line)
+        common = min(len(old_lines), len(lines))
+        for offset in range(common):
+            self._lines[first_line + offset] = lines[offset]
+        for _ in range(len(old_lines) - common):
+            del self._lines[first_line + common]
+        self._lines.insert_lines(first_line + common, lines[common:])
+        self._emit_change(first_line, tuple(old_lines), tuple(lines))
+
+    @_modifies_document
+    def append_lines(self, lines: Sequence[str]) -> None:
+        """Append the lines to the document, which are only read when accessed."""
+        if not lines:
+            return
+        first_line = len(self._lines)
+        self._lines.extend(lines)
+        # appending does not move any existing line, so the recorded history stays valid
+        self._emit_change(first_line, (), lines, record=False)
+
+    @_modifies_document
+    def replace(
+        self,
+        pattern: str | Pattern[str],
+        substitute: str,
+        *,
+        first_line: int = 0,
+        end_line: int | None = None,
+        count: int = 0,
+    ) -> int:
+        """Replace the matches of the pattern in the lines first_line, ..., end_line - 1 by the substitute.
+
+        If count is positive, at most count matches are replaced. Only the lines which actually change
+        are written and reported. Return the number of replaced matches.
+        """
         compiled_pattern = re.compile(pattern)
-        self._lines = [compiled_pattern.sub(substitute, line) for line in self._lines]
+        # a literal pattern can rule out a whole block of lines at once
+        literal = _get_literal(compiled_pattern)
+        end_line = len(self._lines) if end_line is None else min(end_line, len(self._lines))
+        replaced = 0
+        for block_start in range(max(first_line, 0), end_line, self._REPLACE_BLOCK_SIZE):
+            lines = self._lines.get_lines(block_start, min(block_start + self._REPLACE_BLOCK_SIZE, end_line))
+            if literal is not None and literal not in "\n".join(lines):
+                continue
+            for line_number, line in enumerate(lines, block_start):
+                new_line, replaced_in_line = compiled_pattern.subn(substitute, line, count and count - replaced)
+                if not replaced_in_line:
+                    continue
+                replaced += replaced_in_line
+                if new_line != line:
+                    self._lines[line_number] = new_line
+                    self._emit_change(line_number, (line,), (new_line,))
+                if replaced == count:
+                    return replaced
+        return replaced
+
+    @_modifies_document
+    def undo(self) -> tuple[int, int] | None:
+        """Revert the most recent undo step, and return the position of its first change."""
+        step = self.history.take_undo_step()
+        if step is None:
+            return None
+        for operation in reversed(step):
+            self._apply(operation.inverted())
+        self.history.add_redo_step(step)
+        return _get_position(step[0])
+
+    @_modifies_document
+    def redo(self) -> tuple[int, int] | None:
+        """Reapply the most recently undone step, and return the position of its first change."""
+        step = self.history.take_redo_step()
+        if step is None:
+            return None
+        for operation in step:
+            self._apply(operation)
+        self.history.add_undo_step(step)
+        return _get_position(step[0])
+
+    def begin_undo_group(self) -> None:
+        """Make all changes up to end_undo_group() a single undo step."""
+        self.history.begin_group()
+
+    def end_undo_group(self) -> None:
+        self.history.end_group()
+
+    def _apply(self, operation: Operation) -> None:
+        self._recording = False
+        try:
+            if isinstance(operation, LineEdit):
+                old_line = self._lines[operation.line]
+                column = operation.column
+                line = old_line[:column] + operation.new_text + old_line[column + len(operation.old_text) :]
+                self._lines[operation.line] = line
+                self._emit_change(operation.line, (old_line,), (line,))
+            else:
+                end_line = operation.first_line + len(operation.old_lines)
+                self._replace_lines(operation.first_line, end_line, operation.new_lines)
+        finally:
+            self._recording = True
 
     @property
     def text(self) -> str:
         return "\n".join(self._lines)
 
     def get_coordinates(self, index: int) -> tuple[int, int]:
-        line_number = 0
-        char_counter = 0
+        return self._lines.locate_offset(index)
 
-        while char_counter + len(self._lines[line_number]) + 1 <= index:
-            char_counter += len(self._lines[line_number]) + 1
-            line_number += 1
+    def get_index(self, line: int, column: int) -> int:
+        return self._lines.get_offset(line) + column
 
-        return line_number, index - char_counter
+    def snapshot(self) -> "Document":
+        """Return a copy of the document without subscribers, which may be modified independently.
 
-    def get_index(self, line: int, column: int) -> int:
-        return sum(len(l) + 1 for l in self._lines[:line]) + column
+        The copy records no undo history, as it is only used to work on the document in the background.
+        """
+        snapshot = Document([], self.path, storage=self._lines.copy(), undo_budget=0)
+        snapshot._version = self._version
+        return snapshot
 
     def subscribe(self, handler: Callable[[], None]) -> None:
         self._subscribers.append(handler)
@@ -125,3 +320,38 @@ class Document:
     def unsubscribe(self, handler: Callable[[], None]) -> None:
         if handler in self._subscribers:
             self._subscribers.remove(handler)
+
+    def subscribe_changes(self, handler: Callable[[DocumentChange], None]) -> None:
+        """Subscribe to the individual changes of the document, in the order they are made."""
+        self._change_subscribers.append(handler)
+
+    def unsubscribe_changes(self, handler: Callable[[DocumentChange], None]) -> None:
+        if handler in self._change_subscribers:
+            self._change_subscribers.remove(handler)
+
+    def _emit_change(
+        self, first_line: int, old_lines: Sequence[str], new_lines: Sequence[str], *, record: bool = True
+    ) -> None:
+        if record and self._recording:
+            self.history.record(first_line, old_lines, new_lines)
+        self._version += 1
+        if not self._change_subscribers:
+            return
+        started = time.perf_counter()
+        change = DocumentChange(self._version, first_line, old_lines, new_lines)
+        for handler in self._change_subscribers:
+            handler(change)
+        performance.add("notify", started)
+
+
+def _get_position(operation: Operation) -> tuple[int, int]:
+    if isinstance(operation, LineEdit):
+        return operation.line, operation.column
+    return operation.first_line, 0
+
+
+def _get_literal(pattern: Pattern[str]) -> str | None:
+    """Return the text matched by the pattern if it is a plain string (possibly with escapes), else None."""
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE) or not _LITERAL_PATTERN.fullmatch(pattern.pattern):
+        return None
+    return _ESCAPED_CHARACTER.sub(r"\1", pattern.pattern)
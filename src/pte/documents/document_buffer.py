@@ -1,9 +1,11 @@
 import logging
+import time
 
+from pte import performance
 from pte.syntax_highlighting import NoOpHighlighter, SyntaxHighlighter
 
 from .cursor import Cursor
-from .document import Document
+from .document import Document, DocumentChange
 
 
 log = logging.getLogger(__name__)
@@ -20,6 +22,7 @@ class DocumentBuffer:
         self.cursor: Cursor = cursor or Cursor(document)
 
         self._highlighter: SyntaxHighlighter = NoOpHighlighter()
+        self.document.subscribe_changes(self._update_highlighter)
         if highlighter:
             self.highlighter = highlighter
 
@@ -29,7 +32,13 @@ class DocumentBuffer:
 
     @highlighter.setter
     def highlighter(self, highlighter: SyntaxHighlighter) -> None:
-        self.document.unsubscribe(self._highlighter.update)
         self._highlighter = highlighter
-        self.document.subscribe(highlighter.update)
-        log.info(f"Setting highlighter: '{highlighter}'.")
+        log.info("Setting highlighter: '%s'.", highlighter)
+
+    def poll(self) -> None:
+        self._highlighter.poll()
+
+    def _update_highlighter(self, change: DocumentChange) -> None:
+        started = time.perf_counter()
+        self._highlighter.update(change)
+        performance.add("highlight", started)
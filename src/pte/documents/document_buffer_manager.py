@@ -1,39 +1,91 @@
+from dataclasses import dataclass
 import logging
+import os
 from pathlib import Path
+from typing import Callable
 
-from pte.syntax_highlighting import PygmentsHighlighter
+from pte import syntax_highlighting
+from pte.syntax_highlighting.highlight_cache import HighlightCache
 
 from .document import Document
 from .document_buffer import DocumentBuffer
+from .file_saver import SaveJob
+from .line_storage import RopeLineStorage
+from .mapped_file import ENCODING, ENCODING_ERRORS, MappedFile
 
 
 log = logging.getLogger(__name__)
 
 
+# Files at least this large are memory-mapped and read lazily instead of being read at once.
+_MAPPED_FILE_THRESHOLD = 32 * 1024 * 1024
+
+
+@dataclass
+class _MappedLoad:
+    """A document whose lines are appended as the index of its mapped file grows."""
+
+    document: Document
+    mapped_file: MappedFile
+    loaded_lines: int = 0
+
+    def publish(self) -> None:
+        """Append the lines indexed since the last call to the document."""
+        number_of_lines = self.mapped_file.number_of_lines
+        if number_of_lines > self.loaded_lines:
+            self.document.append_lines(self.mapped_file.lines(self.loaded_lines, number_of_lines))
+            self.loaded_lines = number_of_lines
+
+    def get_completer(self) -> Callable[[Document], None]:
+        """Return a function adding the lines not yet loaded to a snapshot of the document, once they are indexed."""
+        loaded_lines = self.loaded_lines
+
+        def complete(snapshot: Document) -> None:
+            self.mapped_file.wait()
+            snapshot.append_lines(self.mapped_file.lines(loaded_lines, self.mapped_file.number_of_lines))
+
+        return complete
+
+
 class DocumentBufferManager:
-    def __init__(self) -> None:
+    def __init__(self, highlight_cache: HighlightCache | None = None) -> None:
         self.buffers: list[DocumentBuffer] = []
         self.active_buffer: DocumentBuffer | None = None
+        self._mapped_loads: list[_MappedLoad] = []
+        self._saves: list[tuple[Document, SaveJob]] = []
+        # a message about the progress of background work, to be shown to the user
+        self.message = ""
+        self._highlight_cache = highlight_cache
 
     def load_file(self, path: Path) -> bool:
-        log.info(f"Loading file '{path}'.")
+        log.info("Loading file '%s'.", path)
+        mapped_load = None
         try:
-            with open(path) as fp:
-                lines = fp.read().splitlines()
+            if os.path.getsize(path) >= _MAPPED_FILE_THRESHOLD:
+                mapped_load = _MappedLoad(Document([], path, storage=RopeLineStorage()), MappedFile(path))
+                mapped_load.publish()
+                new_document = mapped_load.document
+            else:
+                with open(path, encoding=ENCODING, errors=ENCODING_ERRORS) as fp:
+                    new_document = Document(fp.read().splitlines(), path)
         except IOError as exc:
-            log.error(f"The following error occured reading '{path}': {exc}.")
+            log.error("The following error occured reading '%s': %s.", path, exc)
             return False
         else:
-            log.info(f"Successfully loaded file '{path}'.")
+            log.info("Successfully loaded file '%s'.", path)
 
-        new_document = Document(lines, path)
-        highlighter = PygmentsHighlighter(new_document)
+        highlighter = syntax_highlighting.PygmentsHighlighter(
+            new_document, background=True if mapped_load else None, cache=self._highlight_cache
+        )
         new_buffer = DocumentBuffer(new_document, highlighter=highlighter)
+        if mapped_load:
+            self._mapped_loads.append(mapped_load)
         self.buffers.append(new_buffer)
         self.active_buffer = new_buffer
         return True
 
     def save_buffer(self, path: Path | None = None) -> bool:
+        """Start saving the active buffer in the background; progress and errors are reported in message."""
         if self.active_buffer is None:
             return False
 
@@ -42,23 +94,73 @@ class DocumentBufferManager:
             log.error("Cannot save buffer, as path was neither provided as argument nor stored in buffer.")
             return False
 
-        log.info(f"Saving buffer to '{path}'.")
-
-        try:
-            with open(path, "w") as fp:
-                for line in self.active_buffer.document:
-                    fp.write(f"{line}\n")
-        except IOError as exc:
-            log.error(f"The following error occured saving buffer to '{path}': {exc}.")
-            return False
+        document = self.active_buffer.document
+        complete_document = None
+        for mapped_load in self._mapped_loads:
+            if mapped_load.document is document:
+                complete_document = mapped_load.get_completer()
 
-        log.info(f"Succesfully saved buffer to '{path}'.")
-        self.active_buffer.document.path = path
+        previous = next((save for _, save in reversed(self._saves) if save.path == path), None)
+        save = SaveJob(document.snapshot(), path, previous=previous, complete_document=complete_document)
+        self._saves.append((document, save))
+        self._update_message()
         return True
 
+    def wait_for_saves(self) -> None:
+        for _, save in self._saves:
+            save.wait()
+        self.poll()
+
+    def wait_for_loads(self) -> None:
+        """Wait until the files being loaded in the background are indexed, and add all their lines."""
+        for mapped_load in self._mapped_loads:
+            mapped_load.mapped_file.wait()
+        self.poll()
+
+    def store_highlights(self) -> None:
+        """Store the highlights of the buffers in the highlight cache, so that reopening the files is faster."""
+        for buffer in self.buffers:
+            if isinstance(buffer.highlighter, syntax_highlighting.PygmentsHighlighter):
+                buffer.highlighter.store_in_cache()
+
     def load_empty_buffer(self) -> None:
         log.info("Creating empty buffer.")
         new_document = Document([])
         new_buffer = DocumentBuffer(new_document)
         self.buffers.append(new_buffer)
         self.active_buffer = new_buffer
+
+    def load_scratch_buffer(self, lines: list[str]) -> None:
+        """Create a buffer for the given lines, which does not belong to a file."""
+        log.info("Creating scratch buffer.")
+        new_buffer = DocumentBuffer(Document(lines))
+        self.buffers.append(new_buffer)
+        self.active_buffer = new_buffer
+
+    def poll(self) -> None:
+        for mapped_load in self._mapped_loads:
+            mapped_load.publish()
+        self._mapped_loads = [
+            mapped_load
+            for mapped_load in self._mapped_loads
+            if not mapped_load.mapped_file.is_complete
+            or mapped_load.loaded_lines < mapped_load.mapped_file.number_of_lines
+        ]
+        for buffer in self.buffers:
+            buffer.poll()
+        if self._saves:
+            self._update_message()
+
+    def _update_message(self) -> None:
+        while self._saves and self._saves[0][1].done:
+            document, save = self._saves.pop(0)
+            if save.error is None:
+                document.path = save.path
+                self.message = f"Saved '{save.path}' ({save.total_lines} lines)"
+            else:
+                self.message = f"Could not save '{save.path}': {save.error}"
+
+        if self._saves:
+            save = self._saves[0][1]
+            progress = save.written_lines * 100 // max(1, save.total_lines)
+            self.message = f"Saving '{save.path}' ({progress}%)"
@@ -0,0 +1,85 @@
+from typing import Iterable
+
+
+class FenwickTree:
+    """A binary indexed tree over a growable list of integer values.
+
+    Supports point updates and prefix sums in O(log n), as well as searching for the position at
+    which the prefix sums exceed a given value (assuming all values are non-negative).
+    """
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        self._tree: list[int] = [0]
+        self._tree.extend(values)
+        size = len(self._tree)
+        for index in range(1, size):
+            parent = index + (index & -index)
+            if parent < size:
+                self._tree[parent] += self._tree[index]
+
+    def __len__(self) -> int:
+        return len(self._tree) - 1
+
+    def add(self, position: int, delta: int) -> None:
+        """Add delta to the value at the given (zero-based) position."""
+        index = position + 1
+        size = len(self._tree)
+        while index < size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def append(self, value: int) -> None:
+        """Add a value at a new position after the last one."""
+        index = len(self._tree)
+        # the new node holds the sum of the values at the (one-based) positions index - lowbit(index) + 1, ..., index
+        self._tree.append(value + self.prefix_sum(index - 1) - self.prefix_sum(index - (index & -index)))
+
+    def extend(self, values: Iterable[int]) -> None:
+        """Add values at new positions after the last one, in time linear in their number."""
+        old_size = len(self._tree)
+        self._tree.extend(values)
+        size = len(self._tree)
+        # the old nodes not covered by other old nodes (those summed up by prefix_sum()) may be covered by new ones
+        index = old_size - 1
+        while index > 0:
+            parent = index + (index & -index)
+            if parent < size:
+                self._tree[parent] += self._tree[index]
+            index -= index & -index
+        for index in range(old_size, size):
+            parent = index + (index & -index)
+            if parent < size:
+                self._tree[parent] += self._tree[index]
+
+    def truncate(self, length: int) -> None:
+        """Remove the values at the positions from length on."""
+        del self._tree[length + 1 :]
+
+    def prefix_sum(self, end: int) -> int:
+        """Return the sum of the values at the positions 0, ..., end - 1."""
+        total = 0
+        index = min(end, len(self))
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def total(self) -> int:
+        return self.prefix_sum(len(self))
+
+    def search(self, value: int) -> tuple[int, int]:
+        """Find the first position at which the prefix sum exceeds the given value.
+
+        Returns the position together with the sum of all values before it. If value is greater
+        than or equal to the total, the returned position equals the number of values.
+        """
+        position = 0
+        remaining = value
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_position = position + step
+            if next_position < len(self._tree) and self._tree[next_position] <= remaining:
+                position = next_position
+                remaining -= self._tree[next_position]
+            step >>= 1
+        return position, value - remaining
@@ -0,0 +1,164 @@
+import logging
+import os
+from pathlib import Path
+import stat
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from pte import wakeup
+
+from .document import Document
+from .mapped_file import ENCODING, ENCODING_ERRORS
+
+
+log = logging.getLogger(__name__)
+
+
+def _get_umask() -> int:
+    # the umask can only be read by setting it, which is done once, before any files are saved
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _get_umask()
+
+
+class SaveJob:
+    """Saves a document to a file in a background thread.
+
+    The document must not be modified while it is saved, so it is usually a snapshot. The lines are
+    written in large batches to a temporary file in the same directory, which is synced to disk and
+    then renamed to the target path (or to the target of a symbolic link). The target therefore is
+    either left untouched or completely replaced, even if saving fails or is interrupted. Rather
+    than being truncated, the original file stays readable as long as it is open (e.g.
+    memory-mapped), even after being replaced.
+
+    Jobs saving to the same path must be chained via previous, so that they finish in order.
+    """
+
+    _BATCH_SIZE = 4096
+    _NOTIFY_INTERVAL = 0.1
+
+    def __init__(
+        self,
+        document: Document,
+        path: Path,
+        *,
+        previous: "SaveJob | None" = None,
+        complete_document: Callable[[Document], None] | None = None,
+    ) -> None:
+        self.path = path
+        self.document = document
+        self.written_lines = 0
+        self.error: Exception | None = None
+
+        self._previous = previous
+        # called in the background before saving, e.g. to add lines of a file still being loaded
+        self._complete_document = complete_document
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name=f"Saving '{path}'", daemon=True).start()
+
+    @property
+    def total_lines(self) -> int:
+        return self.document.number_of_lines()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self) -> None:
+        self._done.wait()
+
+    def _run(self) -> None:
+        if self._previous is not None:
+            self._previous.wait()
+            self._previous = None
+
+        log.info("Saving buffer to '%s'.", self.path)
+        try:
+            if self._complete_document is not None:
+                self._complete_document(self.document)
+            self._save()
+        except (IOError, UnicodeError) as exc:
+            log.error("The following error occured saving buffer to '%s': %s.", self.path, exc)
+            self.error = exc
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            # a bug must not leave the save pending forever, nor pass for success
+            log.error("An unexpected error occured saving buffer to '%s'.", self.path, exc_info=True)
+            self.error = exc
+        else:
+            log.info("Succesfully saved buffer to '%s'.", self.path)
+        finally:
+            self._done.set()
+            wakeup.notify()
+
+    def _save(self) -> None:
+        # replace the target of a symbolic link, rather than the link
+        path = Path(os.path.realpath(self.path))
+        temporary_path: Path | None = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w",
+                dir=path.parent,
+                prefix=f".{path.name}.",
+                delete=False,
+                encoding=ENCODING,
+                errors=ENCODING_ERRORS,
+            ) as fp:
+                temporary_path = Path(fp.name)
+                notified_at = time.monotonic()
+                total_lines = self.total_lines
+                for start in range(0, total_lines, self._BATCH_SIZE):
+                    lines = self.document.get_lines(start, start + self._BATCH_SIZE)
+                    lines.append("")
+                    fp.write("\n".join(lines))
+                    self.written_lines = start + len(lines) - 1
+                    if time.monotonic() - notified_at >= self._NOTIFY_INTERVAL:
+                        wakeup.notify()
+                        notified_at = time.monotonic()
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            _set_permissions(temporary_path, path)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if temporary_path is not None:
+                temporary_path.unlink(missing_ok=True)
+            raise
+        _sync_directory(path.parent)
+
+
+def _set_permissions(temporary_path: Path, path: Path) -> None:
+    """Give the temporary file the mode, owner and group of the file it replaces, or the mode of a new file."""
+    try:
+        status = os.stat(path)
+    except FileNotFoundError:
+        os.chmod(temporary_path, 0o666 & ~_UMASK)
+        return
+    # change the owner first, as that may clear the setuid and setgid bits
+    for uid in (status.st_uid, -1):
+        try:
+            os.chown(temporary_path, uid, status.st_gid)
+            break
+        except OSError:
+            # only privileged users may give files away, or to groups they are not a member of
+            pass
+    os.chmod(temporary_path, stat.S_IMODE(status.st_mode))
+
+
+def _sync_directory(directory: Path) -> None:
+    """Make a rename within the directory durable."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # not supported by every platform and file system
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,292 @@
+from bisect import bisect_right
+from itertools import accumulate, chain
+from typing import Iterator, Sequence
+
+from typing_extensions import Protocol
+
+from .fenwick_tree import FenwickTree
+
+
+class LineStorage(Protocol):
+    """The storage engine holding the lines of a document."""
+
+    def __len__(self) -> int:
+        ...
+
+    def __getitem__(self, line_number: int) -> str:
+        ...
+
+    def __setitem__(self, line_number: int, line: str) -> None:
+        ...
+
+    def __delitem__(self, line_number: int) -> None:
+        ...
+
+    def __iter__(self) -> Iterator[str]:
+        ...
+
+    def insert(self, line_number: int, line: str) -> None:
+        ...
+
+    def insert_lines(self, line_number: int, lines: Sequence[str]) -> None:
+        ...
+
+    def extend(self, lines: Sequence[str]) -> None:
+        ...
+
+    def copy(self) -> "LineStorage":
+        ...
+
+    def get_lines(self, start: int, stop: int) -> list[str]:
+        ...
+
+    def get_offset(self, line_number: int) -> int:
+        ...
+
+    def locate_offset(self, index: int) -> tuple[int, int]:
+        ...
+
+
+class ListLineStorage:
+    """Stores the lines in a plain list.
+
+    Cheap for small documents, but inserting or deleting lines shifts all subsequent lines.
+    The offset index is a Fenwick tree over the line lengths of a prefix of the lines; it is updated
+    in place when a line changes, cut off before lines inserted or deleted (like the list, it cannot
+    shift the lines after them), and extended over the remaining lines when it is next used.
+    """
+
+    def __init__(self, lines: list[str]) -> None:
+        self._lines = lines
+        self._offsets = FenwickTree()
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __getitem__(self, line_number: int) -> str:
+        return self._lines[line_number]
+
+    def __setitem__(self, line_number: int, line: str) -> None:
+        line_number = range(len(self._lines))[line_number]
+        if line_number < len(self._offsets):
+            self._offsets.add(line_number, len(line) - len(self._lines[line_number]))
+        self._lines[line_number] = line
+
+    def __delitem__(self, line_number: int) -> None:
+        line_number = range(len(self._lines))[line_number]
+        del self._lines[line_number]
+        self._offsets.truncate(line_number)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._lines)
+
+    def insert(self, line_number: int, line: str) -> None:
+        self.insert_lines(line_number, [line])
+
+    def insert_lines(self, line_number: int, lines: Sequence[str]) -> None:
+        start, _, _ = slice(line_number, line_number).indices(len(self._lines))
+        self._lines[start:start] = lines
+        self._offsets.truncate(start)
+
+    def extend(self, lines: Sequence[str]) -> None:
+        self._lines.extend(lines)
+
+    def copy(self) -> "ListLineStorage":
+        return ListLineStorage(list(self._lines))
+
+    def get_lines(self, start: int, stop: int) -> list[str]:
+        return self._lines[start:stop]
+
+    def get_offset(self, line_number: int) -> int:
+        return self._get_offsets().prefix_sum(line_number)
+
+    def locate_offset(self, index: int) -> tuple[int, int]:
+        line_number, offset = self._get_offsets().search(index)
+        if line_number >= len(self._lines):
+            raise IndexError(f"Index {index} out of range.")
+        return line_number, index - offset
+
+    def _get_offsets(self) -> FenwickTree:
+        indexed = len(self._offsets)
+        if indexed < len(self._lines):
+            self._offsets.extend(len(line) + 1 for line in self._lines[indexed:])
+        return self._offsets
+
+
+class RopeLineStorage:
+    """Stores the lines in a sequence of bounded chunks, indexed by a Fenwick tree over the chunk sizes.
+
+    Locating a line costs O(log n), and inserting or deleting a line only shifts the lines within a
+    single chunk. Chunks are split when they grow beyond _MAX_CHUNK_SIZE and dropped when they
+    become empty; only then is the index rebuilt. A second Fenwick tree over the number of
+    characters per chunk serves as offset index, together with the offsets of the lines within
+    each chunk, so that converting between line/column and character index costs O(log n). Both
+    are built lazily, as they require reading the lines; the offsets within a chunk are dropped
+    whenever it changes.
+
+    Chunks may be read-only sequences (e.g. lines of a memory-mapped file, which are decoded on
+    access); such a chunk is copied into a list when it is first modified.
+    """
+
+    _MAX_CHUNK_SIZE = 1024
+
+    def __init__(self, lines: Sequence[str] = ()) -> None:
+        self._chunks: list[Sequence[str]] = [[]]
+        self._length = 0
+        self._sizes = FenwickTree([0])
+        self._char_sizes: FenwickTree | None = None
+        # the offsets of the lines within a chunk (and of its end), by the index of the chunk
+        self._line_offsets: dict[int, list[int]] = {}
+        self.extend(lines)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, line_number: int) -> str:
+        chunk_index, offset = self._locate(line_number)
+        return self._chunks[chunk_index][offset]
+
+    def __setitem__(self, line_number: int, line: str) -> None:
+        chunk_index, offset = self._locate(line_number)
+        chunk = self._get_writable_chunk(chunk_index)
+        if self._char_sizes is not None:
+            self._char_sizes.add(chunk_index, len(line) - len(chunk[offset]))
+        chunk[offset] = line
+        self._line_offsets.pop(chunk_index, None)
+
+    def __delitem__(self, line_number: int) -> None:
+        chunk_index, offset = self._locate(line_number)
+        chunk = self._get_writable_chunk(chunk_index)
+        removed_line = chunk.pop(offset)
+        self._length -= 1
+        if not chunk and len(self._chunks) > 1:
+            del self._chunks[chunk_index]
+            self._rebuild_index()
+        else:
+            self._sizes.add(chunk_index, -1)
+            if self._char_sizes is not None:
+                self._char_sizes.add(chunk_index, -len(removed_line) - 1)
+            self._line_offsets.pop(chunk_index, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return chain.from_iterable(self._chunks)
+
+    def insert(self, line_number: int, line: str) -> None:
+        self.insert_lines(line_number, [line])
+
+    def insert_lines(self, line_number: int, lines: Sequence[str]) -> None:
+        if not lines:
+            return
+        if line_number < 0:
+            line_number = max(0, line_number + len(self))
+        if line_number >= len(self):
+            chunk_index = len(self._chunks) - 1
+            offset = len(self._chunks[chunk_index])
+        else:
+            chunk_index, offset = self._locate(line_number)
+
+        chunk = self._get_writable_chunk(chunk_index)
+        chunk[offset:offset] = lines
+        self._length += len(lines)
+        if len(chunk) > self._MAX_CHUNK_SIZE:
+            # split into chunks of at least half the maximum size
+            parts = len(chunk) // (self._MAX_CHUNK_SIZE // 2)
+            bounds = [len(chunk) * part // parts for part in range(parts + 1)]
+            self._chunks[chunk_index : chunk_index + 1] = [chunk[start:end] for start, end in zip(bounds, bounds[1:])]
+            self._rebuild_index()
+        else:
+            self._sizes.add(chunk_index, len(lines))
+            if self._char_sizes is not None:
+                self._char_sizes.add(chunk_index, sum(len(line) + 1 for line in lines))
+            self._line_offsets.pop(chunk_index, None)
+
+    def extend(self, lines: Sequence[str]) -> None:
+        """Append the lines in new chunks, which keep slices of the given sequence rather than copies."""
+        if not lines:
+            return
+        if self._length == 0:
+            self._chunks.clear()
+            self._sizes = FenwickTree()
+            self._line_offsets = {}
+        half = self._MAX_CHUNK_SIZE // 2
+        for start in range(0, len(lines), half):
+            chunk = lines[start : start + half]
+            self._chunks.append(chunk)
+            self._sizes.append(len(chunk))
+        self._length += len(lines)
+        self._char_sizes = None
+
+    def copy(self) -> "RopeLineStorage":
+        """Return a copy, which shares the read-only chunks with this storage."""
+        storage = RopeLineStorage()
+        storage._chunks = [list(chunk) if isinstance(chunk, list) else chunk for chunk in self._chunks]
+        storage._length = self._length
+        storage._rebuild_index()
+        return storage
+
+    def get_lines(self, start: int, stop: int) -> list[str]:
+        start, stop = max(start, 0), min(stop, self._length)
+        if start >= stop:
+            return []
+        chunk_index, offset = self._locate(start)
+        lines = list(self._chunks[chunk_index][offset : offset + stop - start])
+        while len(lines) < stop - start:
+            chunk_index += 1
+            lines.extend(self._chunks[chunk_index][: stop - start - len(lines)])
+        return lines
+
+    def get_offset(self, line_number: int) -> int:
+        char_sizes = self._get_char_sizes()
+        if line_number >= self._length:
+            return char_sizes.total()
+        chunk_index, offset = self._locate(line_number)
+        return char_sizes.prefix_sum(chunk_index) + self._get_line_offsets(chunk_index)[offset]
+
+    def locate_offset(self, index: int) -> tuple[int, int]:
+        chunk_index, chars_before = self._get_char_sizes().search(index)
+        if chunk_index >= len(self._chunks):
+            raise IndexError(f"Index {index} out of range.")
+        line_offsets = self._get_line_offsets(chunk_index)
+        offset = bisect_right(line_offsets, index - chars_before) - 1
+        return self._sizes.prefix_sum(chunk_index) + offset, index - chars_before - line_offsets[offset]
+
+    def _locate(self, line_number: int) -> tuple[int, int]:
+        if line_number < 0:
+            line_number += self._length
+        if not 0 <= line_number < self._length:
+            raise IndexError(f"Line number {line_number} out of range.")
+        chunk_index, lines_before = self._sizes.search(line_number)
+        return chunk_index, line_number - lines_before
+
+    def _get_writable_chunk(self, chunk_index: int) -> list[str]:
+        chunk = self._chunks[chunk_index]
+        if not isinstance(chunk, list):
+            chunk = self._chunks[chunk_index] = list(chunk)
+        return chunk
+
+    def _get_char_sizes(self) -> FenwickTree:
+        if self._char_sizes is None:
+            self._char_sizes = FenwickTree(sum(len(line) + 1 for line in chunk) for chunk in self._chunks)
+        return self._char_sizes
+
+    def _get_line_offsets(self, chunk_index: int) -> list[int]:
+        line_offsets = self._line_offsets.get(chunk_index)
+        if line_offsets is None:
+            line_offsets = list(accumulate((len(line) + 1 for line in self._chunks[chunk_index]), initial=0))
+            self._line_offsets[chunk_index] = line_offsets
+        return line_offsets
+
+    def _rebuild_index(self) -> None:
+        self._sizes = FenwickTree(len(chunk) for chunk in self._chunks)
+        self._char_sizes = None
+        self._line_offsets = {}
+
+
+_ROPE_THRESHOLD = 10_000
+
+
+def create_line_storage(lines: list[str]) -> LineStorage:
+    """Choose a storage engine suitable for the number of lines."""
+    if len(lines) >= _ROPE_THRESHOLD:
+        return RopeLineStorage(lines)
+    return ListLineStorage(lines)
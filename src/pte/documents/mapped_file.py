@@ -0,0 +1,160 @@
+from array import array
+from itertools import accumulate
+import logging
+import mmap
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Iterator, Sequence, overload
+import weakref
+
+from pte import wakeup
+
+
+log = logging.getLogger(__name__)
+
+
+ENCODING = "utf-8"
+# undecodable bytes are kept as lone surrogates, so that they are written back unchanged
+ENCODING_ERRORS = "surrogateescape"
+
+
+class MappedFile:
+    """A read-only, memory-mapped file, split into lines by an index that is built in a background thread.
+
+    Lines are separated by "\\n" (a preceding "\\r" is dropped), and only decoded when accessed.
+    Only the lines indexed so far are available; apart from the first block, which is indexed right
+    away, the index grows block by block in the background, periodically waking up the main loop.
+    """
+
+    _FIRST_BLOCK_SIZE = 1 << 16
+    # kept small, as the indexing thread holds the GIL while splitting a block
+    _BLOCK_SIZE = 1 << 20
+    _NOTIFY_INTERVAL = 0.1
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as fp:
+            self._size = os.fstat(fp.fileno()).st_size
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+
+        # start offsets of the lines; the line i ends right before _line_starts[i + 1] - 1 (the newline)
+        self._line_starts = array("q", [0])
+        self._number_of_lines = 0
+        self._indexed_size = 0
+        self._lock = threading.Lock()
+        self._complete = threading.Event()
+        _mapped_files.add(self)
+
+        # index the first block right away, so that the first screen can be shown immediately
+        self._index_block(self._FIRST_BLOCK_SIZE)
+        if self._indexed_size < self._size:
+            threading.Thread(target=self._build_index, name=f"Indexing '{path}'", daemon=True).start()
+        else:
+            self._finish_index()
+
+    @property
+    def number_of_lines(self) -> int:
+        """The number of lines indexed so far."""
+        return self._number_of_lines
+
+    @property
+    def is_complete(self) -> bool:
+        return self._complete.is_set()
+
+    def wait(self) -> None:
+        """Wait until the index is complete."""
+        self._complete.wait()
+
+    def get_line(self, line_number: int) -> str:
+        return self.get_lines(line_number, line_number + 1)[0]
+
+    def get_lines(self, start: int, stop: int) -> list[str]:
+        """Decode the lines start, ..., stop - 1 at once."""
+        if start >= stop:
+            return []
+        assert self._mmap is not None
+        with self._lock:
+            begin = self._line_starts[start]
+            end = self._line_starts[stop] - 1 if stop < len(self._line_starts) else self._size
+        text = self._mmap[begin:end].decode(ENCODING, ENCODING_ERRORS)
+        if "\r" not in text:
+            return text.split("\n")
+        return [line[:-1] if line.endswith("\r") else line for line in text.split("\n")]
+
+    def lines(self, start: int, stop: int) -> "MappedLines":
+        return MappedLines(self, range(start, stop))
+
+    def _build_index(self) -> None:
+        log.info("Indexing lines of '%s'.", self.path)
+        notified_at = time.monotonic()
+        while self._indexed_size < self._size:
+            self._index_block(self._BLOCK_SIZE)
+            if time.monotonic() - notified_at >= self._NOTIFY_INTERVAL:
+                wakeup.notify()
+                notified_at = time.monotonic()
+        self._finish_index()
+        wakeup.notify()
+
+    def _index_block(self, block_size: int) -> None:
+        if self._mmap is None:
+            return
+        position = self._indexed_size
+        block = self._mmap[position : position + block_size]
+        # the start of the line after each newline in the block; the last piece is not terminated by a newline
+        starts = array("q", accumulate((len(piece) + 1 for piece in block.split(b"\n")[:-1]), initial=position))
+        with self._lock:
+            self._line_starts.extend(starts[1:])
+            self._number_of_lines = len(self._line_starts) - 1
+        self._indexed_size += len(block)
+
+    def _finish_index(self) -> None:
+        with self._lock:
+            if self._line_starts[-1] < self._size:
+                # the last line is not terminated by a newline
+                self._number_of_lines = len(self._line_starts)
+        self._complete.set()
+        log.info("Indexed %d lines of '%s'.", self._number_of_lines, self.path)
+
+
+# the mapped files, whose locks are replaced in forked children (see SubprocessJob), as the indexing
+# thread holding one is not copied into the child
+_mapped_files: "weakref.WeakSet[MappedFile]" = weakref.WeakSet()
+
+
+def _reset_locks() -> None:
+    for mapped_file in _mapped_files:
+        mapped_file._lock = threading.Lock()  # pylint: disable=protected-access
+
+
+os.register_at_fork(after_in_child=_reset_locks)
+
+
+class MappedLines(Sequence[str]):
+    """A range of lines of a mapped file, decoded on access."""
+
+    def __init__(self, mapped_file: MappedFile, line_numbers: range) -> None:
+        self.mapped_file = mapped_file
+        self.line_numbers = line_numbers
+
+    def __len__(self) -> int:
+        return len(self.line_numbers)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "MappedLines":
+        ...
+
+    def __getitem__(self, index: int | slice) -> "str | MappedLines":
+        if isinstance(index, slice):
+            return MappedLines(self.mapped_file, self.line_numbers[index])
+        return self.mapped_file.get_line(self.line_numbers[index])
+
+    def __iter__(self) -> Iterator[str]:
+        if self.line_numbers.step == 1:
+            return iter(self.mapped_file.get_lines(self.line_numbers.start, self.line_numbers.stop))
+        return map(self.mapped_file.get_line, self.line_numbers)
@@ -0,0 +1,151 @@
+from collections import deque
+import logging
+from typing import NamedTuple, Sequence
+
+
+log = logging.getLogger(__name__)
+
+
+class LineEdit(NamedTuple):
+    """The text old_text at the given position within a line was replaced by new_text."""
+
+    line: int
+    column: int
+    old_text: str
+    new_text: str
+
+    def inverted(self) -> "LineEdit":
+        return LineEdit(self.line, self.column, self.new_text, self.old_text)
+
+
+class LinesReplacement(NamedTuple):
+    """The lines first_line, ..., first_line + len(old_lines) - 1 were replaced by new_lines."""
+
+    first_line: int
+    old_lines: tuple[str, ...]
+    new_lines: tuple[str, ...]
+
+    def inverted(self) -> "LinesReplacement":
+        return LinesReplacement(self.first_line, self.new_lines, self.old_lines)
+
+
+Operation = LineEdit | LinesReplacement
+
+# approximate memory overhead of an operation, in addition to its text
+_OPERATION_OVERHEAD = 100
+
+
+class UndoHistory:
+    """Records the changes of a document as operations, grouped into steps that can be undone and redone.
+
+    Changes within a single line are stored as the replaced part of the line only, and consecutive
+    edits within a group (such as keystrokes in insert mode) are merged whenever the second edit
+    touches only text inserted by the first one, so that typing a word results in a single
+    operation. The history is bounded by a budget (an estimate of its memory use, in characters);
+    if it is exceeded, the oldest steps are dropped. With a budget of 0, nothing is recorded.
+    """
+
+    DEFAULT_BUDGET = 16 * 1024 * 1024
+
+    def __init__(self, budget: int = DEFAULT_BUDGET) -> None:
+        self.budget = budget
+        self._undo_steps: deque[list[Operation]] = deque()
+        self._redo_steps: list[list[Operation]] = []
+        self._current_step: list[Operation] = []
+        self._group_depth = 0
+        self._size = 0
+
+    def record(self, first_line: int, old_lines: Sequence[str], new_lines: Sequence[str]) -> None:
+        if not self.budget:
+            return
+        operation: Operation
+        if len(old_lines) == 1 and len(new_lines) == 1:
+            operation = _get_line_edit(first_line, old_lines[0], new_lines[0])
+            if not operation.old_text and not operation.new_text:
+                return
+            if self._current_step and isinstance(previous := self._current_step[-1], LineEdit):
+                merged = _merge_line_edits(previous, operation)
+                if merged is not None:
+                    self._current_step[-1] = merged
+                    self._size += _get_size(merged) - _get_size(previous)
+                    return
+        else:
+            operation = LinesReplacement(first_line, tuple(old_lines), tuple(new_lines))
+
+        self._current_step.append(operation)
+        self._size += _get_size(operation)
+
+    def begin_group(self) -> None:
+        """Start a group of changes which are undone as a single step, up to the matching end_group()."""
+        self.commit()
+        self._group_depth += 1
+
+    def end_group(self) -> None:
+        self._group_depth = max(0, self._group_depth - 1)
+        self.commit()
+
+    def commit(self) -> None:
+        """Complete the current step, unless a group is open."""
+        if self._group_depth or not self._current_step:
+            return
+        self._undo_steps.append(self._current_step)
+        self._current_step = []
+        for step in self._redo_steps:
+            self._size -= sum(map(_get_size, step))
+        self._redo_steps.clear()
+        self._enforce_budget()
+
+    def take_undo_step(self) -> list[Operation] | None:
+        """Remove the most recent step, to be reverted and passed to add_redo_step()."""
+        self._group_depth = 0
+        self.commit()
+        if not self._undo_steps:
+            return None
+        return self._undo_steps.pop()
+
+    def add_redo_step(self, step: list[Operation]) -> None:
+        self._redo_steps.append(step)
+
+    def take_redo_step(self) -> list[Operation] | None:
+        """Remove the most recently undone step, to be reapplied and passed to add_undo_step()."""
+        if not self._redo_steps:
+            return None
+        return self._redo_steps.pop()
+
+    def add_undo_step(self, step: list[Operation]) -> None:
+        self._undo_steps.append(step)
+
+    def _enforce_budget(self) -> None:
+        dropped_steps = 0
+        while self._size > self.budget and self._undo_steps:
+            self._size -= sum(map(_get_size, self._undo_steps.popleft()))
+            dropped_steps += 1
+        if dropped_steps:
+            log.info("Dropped %d undo steps to stay within the budget of %d.", dropped_steps, self.budget)
+
+
+def _get_line_edit(line: int, old_line: str, new_line: str) -> LineEdit:
+    """Reduce the change of a line to the part between the common prefix and suffix."""
+    max_common = min(len(old_line), len(new_line))
+    prefix = 0
+    while prefix < max_common and old_line[prefix] == new_line[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < max_common - prefix and old_line[-1 - suffix] == new_line[-1 - suffix]:
+        suffix += 1
+    return LineEdit(line, prefix, old_line[prefix : len(old_line) - suffix], new_line[prefix : len(new_line) - suffix])
+
+
+def _merge_line_edits(first: LineEdit, second: LineEdit) -> LineEdit | None:
+    """Merge the edits if the second one only touches text inserted by the first one."""
+    offset = second.column - first.column
+    if second.line != first.line or offset < 0 or offset + len(second.old_text) > len(first.new_text):
+        return None
+    new_text = first.new_text[:offset] + second.new_text + first.new_text[offset + len(second.old_text) :]
+    return LineEdit(first.line, first.column, first.old_text, new_text)
+
+
+def _get_size(operation: Operation) -> int:
+    if isinstance(operation, LineEdit):
+        return _OPERATION_OVERHEAD + len(operation.old_text) + len(operation.new_text)
+    return _OPERATION_OVERHEAD + sum(map(len, operation.old_lines)) + sum(map(len, operation.new_lines))
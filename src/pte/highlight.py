@@ -1,10 +1,36 @@
+from array import array
 from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from typing_extensions import TypeAlias
 
 from pte import colors
 
 
-@dataclass
+@dataclass(slots=True)
 class Highlight:
     column: int
     length: int
     color: colors.Color
+
+
+# The highlights of a line, packed into an array of (column, length, color) triples, sorted by column
+# and without overlaps. Unlike lists of Highlight objects, the arrays take only a few bytes per
+# highlight and are not tracked by the garbage collector. Arrays returned by highlighters are shared,
+# and must not be modified.
+PackedHighlights: TypeAlias = "array[int]"
+
+NO_HIGHLIGHTS: PackedHighlights = array("I")
+
+
+def pack(highlights: Iterable[Highlight]) -> PackedHighlights:
+    packed = array("I")
+    for highlight in highlights:
+        packed.extend((highlight.column, highlight.length, highlight.color))
+    return packed
+
+
+def unpack(packed: PackedHighlights) -> Iterator[tuple[int, int, colors.Color]]:
+    """Return the (column, length, color) triples of packed highlights."""
+    values = iter(packed)
+    return zip(values, values, values)
@@ -2,15 +2,11 @@ from pathlib import Path
 import re
 import string
 
-from pte import colors
+from pte import colors, performance, syntax_highlighting
 from pte.documents import DocumentBuffer, DocumentBufferManager
-from pte.syntax_highlighting import (
-    NoOpHighlighter,
-    PygmentsHighlighter,
-    SyntaxHighlighter,
-)
+from pte.syntax_highlighting import NoOpHighlighter, SyntaxHighlighter
 from pte.syntax_highlighting.regex_highlighter import RegexHighlighter
-from pte.view import MainView
+from pte.view import MainView, PastedText
 
 from .mode import Mode
 from .transition import Transition, TransitionType
@@ -29,7 +25,7 @@ class CommandMode(Mode):
         self._view = view
         self._command_buffer: list[str] = []
         self._command_previewer: _CommandPreviewer = _CommandPreviewer(document_buffer_manager)
-        self._command_executor: _CommandExecutor = _CommandExecutor(document_buffer_manager)
+        self._command_executor: _CommandExecutor = _CommandExecutor(document_buffer_manager, self._command_previewer)
 
     def enter(self, *, command: object = "", **_: object) -> None:
         assert isinstance(command, str)
@@ -43,21 +39,21 @@ class CommandMode(Mode):
         self._view.show_command_line = True
 
     def leave(self) -> None:
+        self._command_previewer.reset()
         self._view.status = f"LEFT {self.name}"
         self._view.show_command_line = False
 
     def draw(self) -> None:
         self._view.command = "".join(self._command_buffer)
 
+        self._command_previewer.highlighter.poll()
         if self._document_buffer_manager.active_buffer:
-            number_of_lines = self._document_buffer_manager.active_buffer.document.number_of_lines()
-            syntax_highlighter = self._document_buffer_manager.active_buffer.highlighter
-            search_highlighter = self._command_previewer.highlighter
-            self._view.highlights = [
-                syntax_highlighter.get_highlights(line) + search_highlighter.get_highlights(line)
-                for line in range(number_of_lines)
+            self._view.highlighters = [
+                self._document_buffer_manager.active_buffer.highlighter,
+                self._command_previewer.highlighter,
             ]
 
+        self._view.message = self._document_buffer_manager.message
         self._view.draw()
 
     def update(self) -> Transition:
@@ -65,6 +61,12 @@ class CommandMode(Mode):
             case "":
                 return TransitionType.STAY
 
+            case PastedText() as text:
+                # a command is a single line
+                self._command_buffer.extend(c for c in text.partition("\n")[0] if c in string.printable)
+                self._command_previewer.update(self._command_buffer)
+                return TransitionType.STAY
+
             case str(c) if c == ESCAPE:
                 self._command_buffer.clear()
                 return (TransitionType.SWITCH, "NORMAL MODE")
@@ -120,19 +122,27 @@ class _CommandPreviewer:
                     _,
                 ]
             ) if active_buffer:
-                self.highlighter = RegexHighlighter(active_buffer, pattern)
+                previous = self.highlighter if isinstance(self.highlighter, RegexHighlighter) else None
+                if previous is not None:
+                    previous.cancel()
+                self.highlighter = RegexHighlighter(active_buffer, pattern, previous=previous)
                 self.highlighter.update()
 
             case _:
                 self.reset()
 
     def reset(self) -> None:
+        if isinstance(self.highlighter, RegexHighlighter):
+            self.highlighter.cancel()
         self.highlighter = NoOpHighlighter()
 
 
 class _CommandExecutor:
-    def __init__(self, document_buffer_manager: DocumentBufferManager) -> None:
+    _SEARCH_TIMEOUT = 2.0
+
+    def __init__(self, document_buffer_manager: DocumentBufferManager, command_previewer: _CommandPreviewer) -> None:
         self._document_buffer_manager = document_buffer_manager
+        self._command_previewer = command_previewer
 
     def execute(self, command: list[str]) -> Transition:
         active_buffer = self._document_buffer_manager.active_buffer
@@ -163,7 +173,7 @@ class _CommandExecutor:
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
             case ["replace", str(pattern), str(substitute)] if active_buffer:
-                active_buffer.document.replace(pattern, substitute)
+                self._replace(active_buffer, pattern, substitute)
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
             case ["nosyntax"] if active_buffer:
@@ -171,29 +181,39 @@ class _CommandExecutor:
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
             case ["syntax"] if active_buffer:
-                active_buffer.highlighter = PygmentsHighlighter(active_buffer.document)
+                active_buffer.highlighter = syntax_highlighting.PygmentsHighlighter(active_buffer.document)
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
             case ["syntax", str(syntax_name)] if active_buffer:
-                active_buffer.highlighter = PygmentsHighlighter(active_buffer.document, syntax_name)
+                active_buffer.highlighter = syntax_highlighting.PygmentsHighlighter(active_buffer.document, syntax_name)
+                return (TransitionType.SWITCH, "NORMAL MODE")
+
+            case ["perf"]:
+                self._document_buffer_manager.load_scratch_buffer(performance.get_report())
+                return (TransitionType.SWITCH, "NORMAL MODE")
+
+            case ["perf", "on" | "off" as setting]:
+                performance.show_latency = setting == "on"
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
             case _:
                 return (TransitionType.SWITCH, "NORMAL MODE")
 
     def _move_to_next_match(self, buffer: DocumentBuffer, pattern: str) -> None:
-        try:
-            compiled_pattern = re.compile(pattern)
-        except re.error:
-            return
+        # the search preview usually knows the next match already
+        highlighter = self._command_previewer.highlighter
+        if not isinstance(highlighter, RegexHighlighter) or highlighter.pattern != pattern:
+            highlighter = RegexHighlighter(buffer, pattern)
+            highlighter.update()
 
-        document = buffer.document
-        cursor = buffer.cursor
+        next_match = highlighter.find_next_match(self._SEARCH_TIMEOUT)
+        if next_match:
+            buffer.cursor.set(*next_match)
 
-        cursor_position = document.get_index(cursor.line, cursor.column)
-        next_match = compiled_pattern.search(document.text, cursor_position + 1)
-        if not next_match:
+    def _replace(self, buffer: DocumentBuffer, pattern: str, substitute: str) -> None:
+        try:
+            replaced = buffer.document.replace(pattern, substitute)
+        except re.error as exc:
+            self._document_buffer_manager.message = f"Invalid pattern '{pattern}': {exc}"
             return
-
-        next_match_index = next_match.start()
-        cursor.set(*document.get_coordinates(next_match_index))
+        self._document_buffer_manager.message = f"Replaced {replaced} matches of '{pattern}'"
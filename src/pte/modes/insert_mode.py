@@ -2,7 +2,7 @@ import string
 
 from pte import colors
 from pte.documents import DocumentBuffer, DocumentBufferManager
-from pte.view import MainView
+from pte.view import MainView, PastedText
 
 from .mode import Mode
 from .transition import Transition, TransitionType
@@ -33,12 +33,16 @@ class InsertMode(Mode):
         self._document_buffer = self._document_buffer_manager.active_buffer
         self._document_buffer.cursor.allow_extra_column = True
         self._document_buffer.highlighter.update()
+        # all changes made in insert mode are undone at once
+        self._document_buffer.document.begin_undo_group()
 
-        self._view.document = list(self._document_buffer.document)
+        self._view.document = self._document_buffer.document
         self._view.status = self.name
         self._view.status_color = colors.GREEN
 
     def leave(self) -> None:
+        if self._document_buffer:
+            self._document_buffer.document.end_undo_group()
         self._view.status = f"LEFT {self.name}"
         self._command_buffer.clear()
 
@@ -46,13 +50,10 @@ class InsertMode(Mode):
         if not self._document_buffer:
             raise NotImplementedError("Cannot run insert mode without active buffer.")
 
-        self._view.document = list(self._document_buffer.document)
+        self._view.document = self._document_buffer.document
         self._view.cursor = (self._document_buffer.cursor.line, self._document_buffer.cursor.column)
-
-        self._view.highlights = [
-            self._document_buffer.highlighter.get_highlights(line)
-            for line in range(self._document_buffer.document.number_of_lines())
-        ]
+        self._view.highlighters = [self._document_buffer.highlighter]
+        self._view.message = self._document_buffer_manager.message
 
         self._view.draw()
 
@@ -66,6 +67,15 @@ class InsertMode(Mode):
         cursor = self._document_buffer.cursor
 
         match self._command_buffer:
+            case [PastedText() as text]:
+                self._command_buffer.clear()
+                lines = text.split("\n")
+                end_line = cursor.line + len(lines) - 1
+                end_column = len(lines[-1]) + (cursor.column if len(lines) == 1 else 0)
+                document.insert(line_number=cursor.line, column_number=cursor.column, text=text)
+                cursor.set(end_line, end_column)
+                return TransitionType.STAY
+
             case [c] if c == ESCAPE:
                 self._command_buffer.clear()
                 cursor.move_left()
@@ -0,0 +1,33 @@
+from typing import Generic, Mapping, Sequence, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Keymap(Generic[T]):
+    """Maps key sequences to commands.
+
+    The keymap is a trie: each node maps the next key to a child node, and holds the command bound to
+    the keys leading to it (if any). So a sequence of keys is resolved one key at a time, in time
+    proportional to its length, and no command can be bound to a prefix of another one.
+    """
+
+    def __init__(self, bindings: Mapping[Sequence[str], T] | None = None) -> None:
+        self.command: T | None = None
+        self._children: dict[str, Keymap[T]] = {}
+        for keys, command in (bindings or {}).items():
+            self.bind(keys, command)
+
+    def bind(self, keys: Sequence[str], command: T) -> None:
+        node = self
+        for key in keys:
+            if node.command is not None:
+                raise ValueError(f"Cannot bind {tuple(keys)}, since a prefix is already bound.")
+            node = node._children.setdefault(key, Keymap())
+        if node._children:
+            raise ValueError(f"Cannot bind {tuple(keys)}, since it is a prefix of another binding.")
+        node.command = command
+
+    def get(self, key: str) -> "Keymap[T] | None":
+        """Return the node for the keys leading to this node followed by key, or None if no binding starts so."""
+        return self._children.get(key)
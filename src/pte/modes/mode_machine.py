@@ -1,19 +1,35 @@
 import logging
+import time
+from typing import Callable
+
+from pte import performance
 
 from .mode import Mode
 from .transition import TransitionType
 
 
 class ModeMachine:
-    def __init__(self, *modes: Mode, logger: logging.Logger | None = None) -> None:
+    def __init__(
+        self,
+        *modes: Mode,
+        logger: logging.Logger | None = None,
+        has_pending_input: Callable[[], bool] | None = None,
+    ) -> None:
         self._mode: Mode | None = None
         self._modes = {mode.name: mode for mode in modes}
         self._logger = logger or logging.getLogger(__name__)
+        self._pollers: list[Callable[[], None]] = []
+        # while more input is pending, it is handled before drawing again
+        self._has_pending_input = has_pending_input or (lambda: False)
+
+    def add_poller(self, poller: Callable[[], None]) -> None:
+        """Register a function picking up the results of background work, called before each draw."""
+        self._pollers.append(poller)
 
     def switch_mode(self, new_mode: Mode | None, **kwargs: object) -> None:
         old_mode = self._mode
 
-        self.info(f"Transitioning from {old_mode} to {new_mode} with arguments {kwargs}.")
+        self.info("Transitioning from %s to %s with arguments %s.", old_mode, new_mode, kwargs)
 
         if old_mode:
             old_mode.leave()
@@ -23,29 +39,44 @@ class ModeMachine:
         if new_mode:
             new_mode.enter(**kwargs)
 
-        self.debug(f"Transitioned from {old_mode} to {new_mode}.")
+        self.debug("Transitioned from %s to %s.", old_mode, new_mode)
 
     def run(self) -> None:
-        self.info(f"Initial mode: {self._mode}.")
+        self.info("Initial mode: %s.", self._mode)
+        # the level does not change while running, and skipping the calls keeps the loop free of logging
+        debug = self._logger.isEnabledFor(logging.DEBUG)
 
         while self._mode:
-            self.debug(f"Draw {self._mode}.")
-            try:
-                self._mode.draw()
-            except:
-                self.error(f"An error occured in {self._mode}.draw().", exc_info=True)
-                raise
-
-            self.debug(f"Update {self._mode}.")
+            for poller in self._pollers:
+                poller()
+
+            if not self._has_pending_input():
+                if debug:
+                    self.debug("Draw %s.", self._mode)
+                started = time.perf_counter()
+                try:
+                    self._mode.draw()
+                except:
+                    self.error("An error occured in %s.draw().", self._mode, exc_info=True)
+                    raise
+                performance.add("draw", started)
+                performance.end_frame()
+
+            if debug:
+                self.debug("Update %s.", self._mode)
+            started = time.perf_counter()
             try:
                 transition = self._mode.update()
             except:
-                self.error(f"An error occured in {self._mode}.update().", exc_info=True)
+                self.error("An error occured in %s.update().", self._mode, exc_info=True)
                 raise
+            # the time spent waiting for input is not part of the update
+            performance.add("update", performance.get_handling_start(started))
 
             match transition:
                 case TransitionType.STAY:
-                    self.debug(f"Stay in {self._mode}.")
+                    if debug:
+                        self.debug("Stay in %s.", self._mode)
                     continue
 
                 case (TransitionType.SWITCH, str(name)) if name in self._modes:
@@ -63,24 +94,24 @@ class ModeMachine:
                     str(name),
                     dict(_),
                 ):
-                    self.error(f"Transition to unknown mode with name '{name}' requested.")
+                    self.error("Transition to unknown mode with name '%s' requested.", name)
                     raise NotImplementedError(f"Transition to unknown mode with name '{name}' requested.")
 
                 case TransitionType.QUIT | None:
-                    self.debug(f"Quit from final mode {self._mode}")
+                    self.debug("Quit from final mode %s", self._mode)
                     break
 
                 case _:
-                    self.error(f"Invalid transition '{transition}' requested.")
+                    self.error("Invalid transition '%s' requested.", transition)
                     raise NotImplementedError(f"Invalid transition '{transition}' requested.")
 
-        self.info(f"Final mode: {self._mode}.")
+        self.info("Final mode: %s.", self._mode)
 
-    def debug(self, message: str) -> None:
-        self._logger.debug(message)
+    def debug(self, message: str, *args: object) -> None:
+        self._logger.debug(message, *args)
 
-    def info(self, message: str) -> None:
-        self._logger.info(message)
+    def info(self, message: str, *args: object) -> None:
+        self._logger.info(message, *args)
 
-    def error(self, message: str, *, exc_info: bool = False) -> None:
-        self._logger.error(message, exc_info=exc_info)
+    def error(self, message: str, *args: object, exc_info: bool = False) -> None:
+        self._logger.error(message, *args, exc_info=exc_info)
@@ -1,7 +1,11 @@
+from functools import wraps
+from typing import Callable
+
 from pte import colors
 from pte.documents import DocumentBuffer, DocumentBufferManager
-from pte.view import MainView
+from pte.view import MainView, PastedText
 
+from .keymap import Keymap
 from .mode import Mode
 from .transition import Transition, TransitionType
 
@@ -30,203 +34,289 @@ class NormalMode(Mode):
         self._command_buffer.clear()
 
     def draw(self) -> None:
+        self._view.message = self._document_buffer_manager.message
         if self._document_buffer:
-            self._view.document = list(self._document_buffer.document)
+            self._view.document = self._document_buffer.document
             self._view.cursor = (
                 self._document_buffer.cursor.line,
                 self._document_buffer.cursor.column,
             )
-
-            self._view.highlights = [
-                self._document_buffer.highlighter.get_highlights(line)
-                for line in range(self._document_buffer.document.number_of_lines())
-            ]
+            self._view.highlighters = [self._document_buffer.highlighter]
 
             self._view.draw(bottom_line_right=str(self._command_buffer))
         else:
             self._view.draw(bottom_line_right="[no buffer]", show_cursor=False)
 
     def update(self) -> Transition:
-        self._command_buffer.append(self._view.read())
+        key = self._view.read()
+        if isinstance(key, PastedText):
+            # there is nothing to paste into
+            self._command_buffer.clear()
+            return TransitionType.STAY
+        self._command_buffer.append(key)
 
-        if self._command_buffer.is_command():
-            transition = self._command_executor.execute(self._command_buffer.store)
+        if self._command_buffer.command is not None:
+            transition = self._command_executor.execute(self._command_buffer.command, self._command_buffer.count)
             self._command_buffer.clear()
             return transition
-        elif not self._command_buffer.is_prefix():
-            self._command_buffer.clear()
 
         return TransitionType.STAY
 
 
-_COMMANDS = {
-    # movement
-    ("h",),
-    ("j",),
-    ("k",),
-    ("l",),
-    ("H",),
-    ("J",),
-    ("K",),
-    ("L",),
-    # deletion
-    ("x",),
-    ("X",),
-    ("d", "d"),
-    # switch to insert mode
-    ("i",),
-    ("a",),
-    ("I",),
-    ("A",),
-    ("o",),
-    ("O",),
-    # switch to command mode
-    (":",),
-    ("/",),
-    ("\x12",),
-    # quitting
-    ("Z", "Z"),
-    ("Z", "Q"),
-}
-
-
 class _CommandBuffer:
+    """The keys typed so far of a command, optionally preceded by a count (such as 20dd)."""
+
     def __init__(self) -> None:
-        self.store: list[str] = []
+        self._count_keys: list[str] = []
+        self._keys: list[str] = []
+        self._node: Keymap[_Command] = _KEYMAP
 
-    def is_command(self) -> bool:
-        return tuple(self.store) in _COMMANDS
+    @property
+    def command(self) -> "_Command | None":
+        return self._node.command
 
-    def is_prefix(self) -> bool:
-        return any(
-            len(self.store) <= len(command) and command[: len(self.store)] == tuple(self.store) for command in _COMMANDS
-        )
+    @property
+    def count(self) -> int:
+        return int("".join(self._count_keys)) if self._count_keys else 1
 
     def append(self, key: str) -> None:
-        if key != "":
-            self.store.append(key)
+        if key == "":
+            return
+        if not self._keys and key.isdigit() and (key != "0" or self._count_keys):
+            self._count_keys.append(key)
+            return
+
+        node = self._node.get(key)
+        if node is None:
+            self.clear()
+            return
+        self._keys.append(key)
+        self._node = node
 
     def clear(self) -> None:
-        self.store.clear()
+        self._count_keys.clear()
+        self._keys.clear()
+        self._node = _KEYMAP
 
     def __str__(self) -> str:
-        return "".join(self.store)
+        return "".join(self._count_keys + self._keys)
+
+
+def _requires_buffer(
+    fn: Callable[["_CommandExecutor", DocumentBuffer, int], Transition]
+) -> Callable[["_CommandExecutor", int], Transition]:
+    """Runs the decorated command on the active buffer; without one, the command does nothing."""
+
+    @wraps(fn)
+    def wrapped_fn(self: "_CommandExecutor", count: int) -> Transition:
+        active_buffer = self._document_buffer_manager.active_buffer  # pylint: disable=protected-access
+        if not active_buffer:
+            return TransitionType.STAY
+        return fn(self, active_buffer, count)
+
+    return wrapped_fn
 
 
 class _CommandExecutor:
+    """Runs the commands of normal mode.
+
+    Each command takes a count (1 unless given), and performs counted edits as a single change.
+    """
+
     def __init__(self, document_buffer_manager: DocumentBufferManager):
         self._document_buffer_manager = document_buffer_manager
 
-    def execute(self, command: list[str]) -> Transition:
-        active_buffer = self._document_buffer_manager.active_buffer
-        if active_buffer:
-            document = active_buffer.document
-            cursor = active_buffer.cursor
-
-        match tuple(command):
-            case ("h",) if active_buffer:
-                cursor.move_left()
-                return TransitionType.STAY
-
-            case ("j",) if active_buffer:
-                cursor.move_down()
-                return TransitionType.STAY
-
-            case ("k",) if active_buffer:
-                cursor.move_up()
-                return TransitionType.STAY
-
-            case ("l",) if active_buffer:
-                cursor.move_right()
-                return TransitionType.STAY
-
-            case ("H",) if active_buffer:
-                cursor.column = 0
-                return TransitionType.STAY
-
-            case ("J",) if active_buffer:
-                cursor.line = cursor.max_line
-                return TransitionType.STAY
-
-            case ("K",) if active_buffer:
-                cursor.line = 0
-                return TransitionType.STAY
-
-            case ("L",) if active_buffer:
-                cursor.column = cursor.max_column
-                return TransitionType.STAY
-
-            case ("x",) if active_buffer and not document.is_empty:
-                document.delete_in_line(line_number=cursor.line, column_number=cursor.column)
-                cursor.column = min(cursor.column, cursor.max_column)
-                return TransitionType.STAY
-
-            case ("X",) if active_buffer and cursor.column > 0 and not document.is_empty:
-                document.delete_in_line(line_number=cursor.line, column_number=cursor.column - 1)
-                cursor.move_left()
-                return TransitionType.STAY
-
-            case ("d", "d") if active_buffer and not document.is_empty:
-                document.delete_line(cursor.line)
-                cursor.line = min(cursor.line, cursor.max_line)
-                cursor.column = 0
-                return TransitionType.STAY
-
-            case ("i",) if active_buffer:
-                if document.is_empty:
-                    document.insert_line(0)
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case ("a",) if active_buffer:
-                if document.is_empty:
-                    document.insert_line(0)
-                cursor.allow_extra_column = True
-                cursor.move_right()
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case ("I",) if active_buffer:
-                if document.is_empty:
-                    document.insert_line(0)
-                cursor.column = 0
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case ("A",) if active_buffer:
-                if document.is_empty:
-                    document.insert_line(0)
-                cursor.allow_extra_column = True
-                cursor.column = cursor.max_column
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case ("o",) if active_buffer:
-                document.insert_line(cursor.line + 1)
-                cursor.move_down()
-                cursor.column = 0
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case ("O",) if active_buffer:
-                document.insert_line(cursor.line)
-                cursor.column = 0
-                return (TransitionType.SWITCH, "INSERT MODE")
-
-            case (":",):
-                return (TransitionType.SWITCH, "COMMAND MODE")
-
-            case ("/",):
-                return (TransitionType.SWITCH, "COMMAND MODE", {"command": "search "})
-
-            case ("\x12",):
-                return (TransitionType.SWITCH, "COMMAND MODE", {"command": "replace "})
-
-            case ("Z", "Z"):
-                if active_buffer:
-                    self._document_buffer_manager.save_buffer()
-                return TransitionType.QUIT
-
-            case ("Z", "Q"):
-                return TransitionType.QUIT
-
-            case cmd if cmd in _COMMANDS:
-                return TransitionType.STAY
-
-            case _:
-                raise ValueError(f"Unknown command: {command}.")
+    def execute(self, command: "_Command", count: int) -> Transition:
+        return command(self, count)
+
+    # movement
+
+    @_requires_buffer
+    def move_left(self, buffer: DocumentBuffer, count: int) -> Transition:
+        buffer.cursor.move_left(count)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_down(self, buffer: DocumentBuffer, count: int) -> Transition:
+        buffer.cursor.move_down(count)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_up(self, buffer: DocumentBuffer, count: int) -> Transition:
+        buffer.cursor.move_up(count)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_right(self, buffer: DocumentBuffer, count: int) -> Transition:
+        buffer.cursor.move_right(count)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_to_line_start(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.cursor.column = 0
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_to_last_line(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.cursor.line = buffer.cursor.max_line
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_to_first_line(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.cursor.line = 0
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def move_to_line_end(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.cursor.column = buffer.cursor.max_column
+        return TransitionType.STAY
+
+    # deletion
+
+    @_requires_buffer
+    def delete_characters(self, buffer: DocumentBuffer, count: int) -> Transition:
+        document, cursor = buffer.document, buffer.cursor
+        if not document.is_empty:
+            document.delete_in_line(line_number=cursor.line, column_number=cursor.column, count=count)
+            cursor.column = min(cursor.column, cursor.max_column)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def delete_characters_before(self, buffer: DocumentBuffer, count: int) -> Transition:
+        document, cursor = buffer.document, buffer.cursor
+        count = min(count, cursor.column)
+        if count > 0 and not document.is_empty:
+            document.delete_in_line(line_number=cursor.line, column_number=cursor.column - count, count=count)
+            cursor.move_left(count)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def delete_lines(self, buffer: DocumentBuffer, count: int) -> Transition:
+        document, cursor = buffer.document, buffer.cursor
+        if not document.is_empty:
+            end_line = min(cursor.line + count, document.number_of_lines())
+            document.replace_lines(cursor.line, end_line, [])
+            cursor.line = min(cursor.line, cursor.max_line)
+            cursor.column = 0
+        return TransitionType.STAY
+
+    # undo
+
+    @_requires_buffer
+    def undo(self, buffer: DocumentBuffer, count: int) -> Transition:
+        for _ in range(count):
+            if not (position := buffer.document.undo()):
+                break
+            buffer.cursor.set(*position)
+        return TransitionType.STAY
+
+    @_requires_buffer
+    def redo(self, buffer: DocumentBuffer, count: int) -> Transition:
+        for _ in range(count):
+            if not (position := buffer.document.redo()):
+                break
+            buffer.cursor.set(*position)
+        return TransitionType.STAY
+
+    # switch to insert mode
+
+    @_requires_buffer
+    def insert(self, buffer: DocumentBuffer, _: int) -> Transition:
+        if buffer.document.is_empty:
+            buffer.document.insert_line(0)
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    @_requires_buffer
+    def append(self, buffer: DocumentBuffer, _: int) -> Transition:
+        if buffer.document.is_empty:
+            buffer.document.insert_line(0)
+        buffer.cursor.allow_extra_column = True
+        buffer.cursor.move_right()
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    @_requires_buffer
+    def insert_at_line_start(self, buffer: DocumentBuffer, _: int) -> Transition:
+        if buffer.document.is_empty:
+            buffer.document.insert_line(0)
+        buffer.cursor.column = 0
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    @_requires_buffer
+    def append_at_line_end(self, buffer: DocumentBuffer, _: int) -> Transition:
+        if buffer.document.is_empty:
+            buffer.document.insert_line(0)
+        buffer.cursor.allow_extra_column = True
+        buffer.cursor.column = buffer.cursor.max_column
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    @_requires_buffer
+    def open_line_below(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.document.insert_line(buffer.cursor.line + 1)
+        buffer.cursor.move_down()
+        buffer.cursor.column = 0
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    @_requires_buffer
+    def open_line_above(self, buffer: DocumentBuffer, _: int) -> Transition:
+        buffer.document.insert_line(buffer.cursor.line)
+        buffer.cursor.column = 0
+        return (TransitionType.SWITCH, "INSERT MODE")
+
+    # switch to command mode
+
+    def enter_command(self, _: int) -> Transition:
+        return (TransitionType.SWITCH, "COMMAND MODE")
+
+    def enter_search(self, _: int) -> Transition:
+        return (TransitionType.SWITCH, "COMMAND MODE", {"command": "search "})
+
+    def enter_replace(self, _: int) -> Transition:
+        return (TransitionType.SWITCH, "COMMAND MODE", {"command": "replace "})
+
+    # quitting
+
+    def save_and_quit(self, _: int) -> Transition:
+        if self._document_buffer_manager.active_buffer:
+            self._document_buffer_manager.save_buffer()
+        return TransitionType.QUIT
+
+    def quit(self, _: int) -> Transition:
+        return TransitionType.QUIT
+
+
+_Command = Callable[[_CommandExecutor, int], Transition]
+
+_KEYMAP: Keymap[_Command] = Keymap(
+    {
+        # movement
+        ("h",): _CommandExecutor.move_left,
+        ("j",): _CommandExecutor.move_down,
+        ("k",): _CommandExecutor.move_up,
+        ("l",): _CommandExecutor.move_right,
+        ("H",): _CommandExecutor.move_to_line_start,
+        ("J",): _CommandExecutor.move_to_last_line,
+        ("K",): _CommandExecutor.move_to_first_line,
+        ("L",): _CommandExecutor.move_to_line_end,
+        # deletion
+        ("x",): _CommandExecutor.delete_characters,
+        ("X",): _CommandExecutor.delete_characters_before,
+        ("d", "d"): _CommandExecutor.delete_lines,
+        # undo
+        ("u",): _CommandExecutor.undo,
+        ("U",): _CommandExecutor.redo,
+        # switch to insert mode
+        ("i",): _CommandExecutor.insert,
+        ("a",): _CommandExecutor.append,
+        ("I",): _CommandExecutor.insert_at_line_start,
+        ("A",): _CommandExecutor.append_at_line_end,
+        ("o",): _CommandExecutor.open_line_below,
+        ("O",): _CommandExecutor.open_line_above,
+        # switch to command mode
+        (":",): _CommandExecutor.enter_command,
+        ("/",): _CommandExecutor.enter_search,
+        ("\x12",): _CommandExecutor.enter_replace,
+        # quitting
+        ("Z", "Z"): _CommandExecutor.save_and_quit,
+        ("Z", "Q"): _CommandExecutor.quit,
+    }
+)
@@ -0,0 +1,99 @@
+"""Timing of the phases of each frame, from reading a key to painting the screen.
+
+The main loop and the code it calls report the time spent in each phase with add(). The times are
+summed up per frame, and end_frame(), called once the screen was painted, records the sums in
+rolling histograms. The latency of a frame is the time from the first key handled in it (see
+mark_input()) until the end of painting.
+"""
+
+from collections import deque
+import math
+import time
+
+
+# the phases, in the order they occur in a frame; notify and highlight are part of update, paint is part of draw
+PHASES = ("read", "update", "notify", "highlight", "draw", "paint")
+LATENCY = "latency"
+_HISTOGRAM_SIZE = 1000
+
+
+class Histogram:
+    """The durations of the most recent frames."""
+
+    def __init__(self, size: int = _HISTOGRAM_SIZE) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def get_percentiles(self, *percentiles: float) -> list[float]:
+        """Return the given percentiles (from 0 to 100) of the recent samples, using the nearest rank."""
+        samples = sorted(self._samples)
+        if not samples:
+            return [math.nan] * len(percentiles)
+        return [samples[max(0, math.ceil(p / 100 * len(samples)) - 1)] for p in percentiles]
+
+
+histograms = {phase: Histogram() for phase in (*PHASES, LATENCY)}
+# whether the status line shows the latency of the last frame
+show_latency = False
+last_latency: float | None = None
+
+_frame: dict[str, float] = {}
+_input_time: float | None = None
+_keystroke_time: float | None = None
+
+
+def add(phase: str, started: float) -> None:
+    """Add the time since started to the given phase of the current frame."""
+    _frame[phase] = _frame.get(phase, 0.0) + time.perf_counter() - started
+
+
+def mark_input(keystroke: bool) -> None:
+    """Note that input was read (a key, or a wake-up), and its handling starts now."""
+    global _input_time, _keystroke_time  # pylint: disable=global-statement
+    _input_time = time.perf_counter()
+    if keystroke and _keystroke_time is None:
+        _keystroke_time = _input_time
+
+
+def get_handling_start(started: float) -> float:
+    """Return when handling the input read since started began, or started if no input was read since."""
+    return max(started, _input_time or started)
+
+
+def end_frame() -> None:
+    global _keystroke_time, last_latency  # pylint: disable=global-statement
+    for phase, seconds in _frame.items():
+        histograms[phase].add(seconds)
+    _frame.clear()
+    if _keystroke_time is not None:
+        last_latency = time.perf_counter() - _keystroke_time
+        histograms[LATENCY].add(last_latency)
+        _keystroke_time = None
+
+
+def get_report() -> list[str]:
+    """Return a table of the percentiles of each phase, and of the latency."""
+    lines = [
+        f"Frame timings in milliseconds, over the last {_HISTOGRAM_SIZE} frames in which a phase occurred",
+        "",
+        f"{'phase':<10} {'frames':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}",
+    ]
+    for phase, histogram in histograms.items():
+        percentiles = histogram.get_percentiles(50, 95, 99, 100)
+        timings = " ".join(f"{seconds * 1000:>9.3f}" for seconds in percentiles)
+        lines.append(f"{phase:<10} {histogram.count:>8} {timings}")
+    lines += [
+        "",
+        "read: reading keys, without waiting for them",
+        "update: handling the keys read, including notify",
+        "notify: notifying the subscribers of documents of changes, including highlight",
+        "highlight: updating the syntax highlighting after changes",
+        "draw: drawing the screen, including paint",
+        "paint: sending the changes of the screen to the terminal",
+        "latency: from the first key handled in a frame until painting the frame",
+    ]
+    return lines
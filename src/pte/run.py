@@ -2,22 +2,34 @@
 
 import argparse
 import curses
-from importlib import metadata
+import importlib
 import logging
+import logging.handlers
 import os
 from pathlib import Path
+import queue
+import re
+import sys
 
 from pte import modes
 from pte.documents import DocumentBufferManager
-from pte.view import MainView
+from pte.syntax_highlighting.highlight_cache import HighlightCache
+from pte.view import CursesScreen, MainView, Screen, VirtualScreen
+from pte.view.main_view import PASTE_END, PASTE_START
 
 
 log = logging.getLogger("pte.run")
 
 
-def set_up_logging() -> None:
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_HEADLESS_SIZE = "24x80"
+
+
+def set_up_logging(level: str) -> logging.handlers.QueueListener:
+    """Log to a file, which is written in a background thread; the returned listener must be stopped at exit."""
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+    logger.setLevel(level)
 
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
@@ -27,41 +39,78 @@ def set_up_logging() -> None:
     fh = logging.FileHandler(log_directory / "log.txt", "w+")
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(formatter)
-    logger.addHandler(fh)
 
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, fh)
+    listener.start()
+    return listener
 
-def get_log_directory() -> Path:
+
+def get_data_directory() -> Path:
     xdg_data_home_env = os.environ.get("XDG_DATA_HOME", None)
     xdg_data_home = Path(xdg_data_home_env) if xdg_data_home_env else Path.home() / ".local" / "share"
-    log_directory = xdg_data_home / "pte" / "log"
-    return log_directory
+    return xdg_data_home / "pte"
+
+
+def get_log_directory() -> Path:
+    return get_data_directory() / "log"
+
+
+class _VersionAction(argparse.Action):
+    """Prints the version and exits; importlib.metadata is slow to import, so only then is it imported."""
+
+    def __init__(self, option_strings: list[str], dest: str, **kwargs: object) -> None:
+        super().__init__(option_strings, dest, nargs=0, help="show program's version number and exit")
+
+    def __call__(self, parser: argparse.ArgumentParser, *_: object) -> None:
+        metadata = importlib.import_module("importlib.metadata")
+        print(metadata.version("pte"))
+        parser.exit()
+
+
+def get_default_log_level() -> str:
+    level = os.environ.get("PTE_LOG_LEVEL", DEFAULT_LOG_LEVEL).upper()
+    return level if level in LOG_LEVELS else DEFAULT_LOG_LEVEL
+
+
+def get_screen_size(text: str) -> tuple[int, int]:
+    match = re.fullmatch(r"(\d+)x(\d+)", text)
+    if match is None or int(match[1]) < 3 or int(match[2]) < 1:
+        raise argparse.ArgumentTypeError(f"invalid screen size '{text}', expected e.g. {DEFAULT_HEADLESS_SIZE}")
+    return int(match[1]), int(match[2])
 
 
 def get_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(prog="pte", description="A modal command-line text editor written in Python")
     parser.add_argument("filename", nargs="?")
-    parser.add_argument("-v", "--version", action="version", version=metadata.version("pte"))
+    parser.add_argument("-v", "--version", action=_VersionAction)
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        choices=LOG_LEVELS,
+        default=get_default_log_level(),
+        help=f"the minimum level of logged messages (default: $PTE_LOG_LEVEL or {DEFAULT_LOG_LEVEL})",
+    )
+    parser.add_argument(
+        "--headless",
+        nargs="?",
+        type=get_screen_size,
+        const=DEFAULT_HEADLESS_SIZE,
+        metavar="LINESxCOLUMNS",
+        help=f"run on a virtual screen (default size: {DEFAULT_HEADLESS_SIZE}), typing the keys read from stdin",
+    )
     return parser.parse_args()
 
 
-def run(stdscr: curses.window, args: argparse.Namespace) -> None:
+def run(screen: Screen, args: argparse.Namespace) -> None:
     log.info("Starting up...")
 
-    log.info("Initializing colors.")
-    curses.set_escdelay(1)
-    curses.use_default_colors()
-    for fg in range(16):
-        curses.init_pair(fg + 1, fg, -1)
-    for bg in range(8):
-        curses.init_pair(bg + 17, -1, bg)
-    for bg in range(8):
-        curses.init_pair(bg + 25, 0, bg)
-
     log.info("Setting up view.")
-    view = MainView(stdscr)
+    view = MainView(screen)
 
     log.info("Setting up document buffer manager.")
-    document_buffer_manager = DocumentBufferManager()
+    document_buffer_manager = DocumentBufferManager(HighlightCache(get_data_directory() / "highlight_cache"))
 
     log.info("Initializing buffers.")
     if args.filename:
@@ -73,17 +122,52 @@ def run(stdscr: curses.window, args: argparse.Namespace) -> None:
     command = modes.CommandMode(document_buffer_manager, view)
 
     log.info("Run mode machine.")
-    mode_machine = modes.ModeMachine(normal, insert, command)
+    mode_machine = modes.ModeMachine(normal, insert, command, has_pending_input=view.has_pending_input)
+    mode_machine.add_poller(document_buffer_manager.poll)
     mode_machine.switch_mode(normal)
-    mode_machine.run()
+    try:
+        mode_machine.run()
+    finally:
+        view.close()
+
+    log.info("Wait for pending saves.")
+    document_buffer_manager.wait_for_saves()
+
+    log.info("Store highlights.")
+    document_buffer_manager.store_highlights()
 
     log.info("Exit.")
 
 
+def run_headless(args: argparse.Namespace) -> None:
+    """Run on a virtual screen, typing the keys read from stdin, and print the final screen and frame statistics.
+
+    Each key is typed in a frame of its own, except for pasted text, which is typed at once.
+    """
+    screen = VirtualScreen(*args.headless)
+    keys = sys.stdin.read()
+    screen.feed(*re.findall(f"{re.escape(PASTE_START)}.*?{re.escape(PASTE_END)}|.", keys, re.DOTALL))
+    try:
+        run(screen, args)
+    except EOFError:
+        log.warning("The input ended before the editor quit.")
+
+    print("\n".join(screen.get_lines()))
+    cells = sum(frame.cells for frame in screen.frames)
+    written_bytes = sum(frame.bytes for frame in screen.frames)
+    print(f"{len(screen.frames)} frames, {cells} cells, {written_bytes} bytes", file=sys.stderr)
+
+
 def main() -> None:
     args = get_args()
-    set_up_logging()
-    curses.wrapper(run, args)
+    listener = set_up_logging(args.log_level)
+    try:
+        if args.headless:
+            run_headless(args)
+        else:
+            curses.wrapper(lambda stdscr: run(CursesScreen(stdscr), args))
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
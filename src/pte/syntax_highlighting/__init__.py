@@ -1,2 +1,22 @@
-from .pygments_highlighter import PygmentsHighlighter
+import importlib
+from typing import TYPE_CHECKING
+
 from .syntax_highlighter import NoOpHighlighter, SyntaxHighlighter
+
+
+if TYPE_CHECKING:
+    from .color_scheme import DEFAULT_COLOR_SCHEME, ColorScheme
+    from .pygments_highlighter import PygmentsHighlighter
+
+# Pygments takes a while to import, so these are only imported once they are accessed
+_LAZY_IMPORTS = {
+    "DEFAULT_COLOR_SCHEME": ".color_scheme",
+    "ColorScheme": ".color_scheme",
+    "PygmentsHighlighter": ".pygments_highlighter",
+}
+
+
+def __getattr__(name: str) -> object:
+    if name in _LAZY_IMPORTS:
+        return getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
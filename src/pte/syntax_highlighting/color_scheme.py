@@ -0,0 +1,68 @@
+from typing import Mapping
+
+from pygments.lexer import Lexer, RegexLexer
+from pygments.token import STANDARD_TYPES, Token, _TokenType
+
+from pte import colors
+
+
+class _ColorTable(dict[_TokenType, colors.Color | None]):
+    """Maps token types to colors, resolving and memoizing token types on first lookup."""
+
+    def __init__(self, token_colors: Mapping[_TokenType, colors.Color]) -> None:
+        super().__init__()
+        self._token_colors = dict(token_colors)
+
+    def __missing__(self, token_type: _TokenType) -> colors.Color | None:
+        # use the color of the closest ancestor in the token type hierarchy
+        family: _TokenType | None = token_type
+        while family is not None and family not in self._token_colors:
+            family = family.parent
+        color = self._token_colors[family] if family is not None else None
+        self[token_type] = color
+        return color
+
+
+class ColorScheme:
+    """Assigns colors to Pygments token types.
+
+    Each token type gets the color of the closest token family (i.e. the token type itself or one
+    of its ancestors) for which the scheme defines a color, or None if there is no such family.
+    Resolved colors are memoized, so that looking up a token type is a single dictionary access
+    after the first time.
+    """
+
+    def __init__(self, token_colors: Mapping[_TokenType, colors.Color]) -> None:
+        self.table = _ColorTable(token_colors)
+        # identifies the colors, e.g. for highlights stored on disk
+        self.fingerprint = repr(sorted((str(token_type), color) for token_type, color in token_colors.items()))
+        for token_type in STANDARD_TYPES:
+            self.table[token_type]  # pylint: disable=pointless-statement
+
+    def get_color(self, token_type: _TokenType) -> colors.Color | None:
+        return self.table[token_type]
+
+    def prepare_for(self, lexer: Lexer) -> None:
+        """Resolve the colors of all token types the lexer emits directly from its token definitions."""
+        if not isinstance(lexer, RegexLexer):
+            return
+        for rules in lexer._tokens.values():  # type: ignore[attr-defined]  # pylint: disable=protected-access
+            for _, action, _ in rules:
+                if isinstance(action, _TokenType):
+                    self.table[action]  # pylint: disable=pointless-statement
+
+
+DEFAULT_COLOR_SCHEME = ColorScheme(
+    {
+        Token.Comment: colors.GRAY,
+        Token.Keyword: colors.BLUE,
+        Token.Literal.Number: colors.CYAN,
+        Token.Literal.String.Affix: colors.YELLOW,
+        Token.Literal.String.Interpol: colors.YELLOW,
+        Token.Literal.String: colors.GREEN,
+        Token.Name.Builtin: colors.BLUE,
+        Token.Name.Class: colors.BRIGHT_YELLOW,
+        Token.Name.Function: colors.MAGENTA,
+        Token.Operator.Word: colors.BLUE,
+    }
+)
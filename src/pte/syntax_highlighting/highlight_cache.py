@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import marshal
+import os
+from pathlib import Path
+import tempfile
+from typing import Iterable, NamedTuple
+import zlib
+
+
+log = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    """The lexer and the lexing results for the first lines of a file.
+
+    The content hash covers exactly the lines the states and highlights are for, and the color
+    scheme fingerprint identifies the colors the highlights were computed with. As the names of
+    lexers and their states may change between versions of Pygments, the version is recorded, too.
+    The highlights of each line are stored as the bytes of their packed array.
+    """
+
+    pygments_version: str
+    lexer_name: str
+    color_scheme: str
+    content_hash: bytes
+    states: list[tuple[str, ...] | None]
+    highlights: list[bytes]
+    far_lines: list[int]
+
+
+class HighlightCache:
+    """Keeps the lexing results of files on disk, so that a file opened again need not be lexed again.
+
+    Entries are looked up by path, size and modification time of the file; each entry records a
+    hash of the lines it covers, which the user of the cache checks against the document. The
+    cache is bounded by the total size of its entries: when it grows beyond max_size, the least
+    recently used entries (by the modification time of their files, which a hit updates) are
+    removed.
+    """
+
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    # part of the key of each entry, so that entries in an older format are not found
+    _FORMAT_VERSION = 4
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+
+    def load(self, path: Path) -> CacheEntry | None:
+        entry_path = self._get_entry_path(path)
+        if entry_path is None:
+            return None
+        try:
+            entry = CacheEntry(*marshal.loads(zlib.decompress(entry_path.read_bytes())))
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, EOFError, zlib.error) as exc:
+            log.warning("Ignoring unreadable highlight cache entry '%s': %s.", entry_path, exc)
+            return None
+        log.info("Loaded %d cached lines for '%s'.", len(entry.states), path)
+        return entry
+
+    def store(self, path: Path, entry: CacheEntry) -> None:
+        entry_path = self._get_entry_path(path)
+        if entry_path is None:
+            return
+        data = zlib.compress(marshal.dumps(tuple(entry)))
+        if len(data) > self.max_size:
+            return
+        temporary_path: Path | None = None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("wb", dir=self.directory, suffix=".tmp", delete=False) as fp:
+                temporary_path = Path(fp.name)
+                fp.write(data)
+            os.replace(temporary_path, entry_path)
+            self._evict()
+        except OSError as exc:
+            log.warning("Could not store highlights of '%s' in the cache: %s.", path, exc)
+            if temporary_path is not None:
+                temporary_path.unlink(missing_ok=True)
+            return
+        log.info("Stored %d lines of highlights for '%s' in the cache.", len(entry.states), path)
+
+    def _get_entry_path(self, path: Path) -> Path | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        key = f"{self._FORMAT_VERSION}\0{path.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        return self.directory / f"{hashlib.sha256(key.encode(errors='surrogateescape')).hexdigest()}.cache"
+
+    def _evict(self) -> None:
+        entries = []
+        for entry_path in self.directory.glob("*.cache"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_size -= size
+            log.debug("Evicted highlight cache entry '%s'.", entry_path)
+
+
+def get_content_hash(lines: Iterable[str]) -> bytes:
+    return hashlib.blake2b("\n".join(lines).encode(errors="surrogateescape"), digest_size=16).digest()
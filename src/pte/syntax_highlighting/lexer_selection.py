@@ -0,0 +1,79 @@
+from fnmatch import fnmatch
+import logging
+from pathlib import Path
+from typing import Sequence
+
+from pygments.lexer import Lexer
+import pygments.lexers
+
+
+log = logging.getLogger(__name__)
+
+
+def select_lexer(path: Path | None, lines: Sequence[str]) -> Lexer:
+    """Choose a lexer for a file, given (a prefix of) its lines.
+
+    The lexer is chosen by file name if possible, and otherwise by the interpreter named in a
+    shebang line. Only if both fail is it guessed from the content, which means trying every lexer.
+    Only the built-in lexers of Pygments are considered by name, since looking up plugins requires
+    importing them.
+    """
+    lexer = None
+    if path is not None:
+        lexer = _get_lexer_for_filename(path.name, lines)
+    if lexer is None and lines and lines[0].startswith("#!"):
+        lexer = _get_lexer_for_shebang(lines[0])
+    if lexer is not None:
+        log.info("Chose lexer with name '%s'.", lexer.name)  # type: ignore[attr-defined]
+        return lexer
+
+    lexer = pygments.lexers.guess_lexer("\n".join(lines))
+    log.info("Guessed lexer with name '%s'.", lexer.name)  # type: ignore[attr-defined]
+    return lexer
+
+
+def _get_lexer_for_filename(filename: str, lines: Sequence[str]) -> Lexer | None:
+    # (explicit pattern, alias) of the lexers whose file name patterns match
+    candidates = [
+        ("*" not in pattern, aliases[0])
+        for _, aliases, patterns, _ in pygments.lexers.get_all_lexers(plugins=False)
+        if aliases
+        for pattern in patterns
+        if fnmatch(filename, pattern)
+    ]
+    if not candidates:
+        return None
+    if len(candidates) == 1:
+        return pygments.lexers.get_lexer_by_name(candidates[0][1])
+
+    # as Pygments does, let the lexers rate the content (or use their priority if there is none), and
+    # prefer patterns without wildcards
+    text = "\n".join(lines)
+    lexer_classes = [(explicit, pygments.lexers.find_lexer_class_by_name(alias)) for explicit, alias in candidates]
+
+    def get_rating(candidate: tuple[bool, type[Lexer]]) -> tuple[float, str]:
+        explicit, lexer_class = candidate
+        rating = lexer_class.analyse_text(text) if text else lexer_class.priority
+        return rating + 0.5 * explicit, lexer_class.__name__
+
+    _, best_class = max(lexer_classes, key=get_rating)
+    return best_class()
+
+
+def _get_lexer_for_shebang(shebang: str) -> Lexer | None:
+    words = shebang[2:].split()
+    if words and Path(words[0]).name == "env":
+        # skip the options of env, e.g. in "#!/usr/bin/env -S python3 -u"
+        words = [word for word in words[1:] if not word.startswith("-")]
+    if not words:
+        return None
+
+    interpreter = Path(words[0]).name
+    aliases = {
+        alias for _, lexer_aliases, _, _ in pygments.lexers.get_all_lexers(plugins=False) for alias in lexer_aliases
+    }
+    # e.g. python3.11 or python
+    for name in (interpreter, interpreter.rstrip("0123456789.")):
+        if name in aliases:
+            return pygments.lexers.get_lexer_by_name(name)
+    return None
@@ -0,0 +1,283 @@
+import re
+from re import _compiler, _parser  # type: ignore[attr-defined]
+from typing import Any, Callable, Iterator
+
+from pygments.lexer import Lexer, RegexLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+from .regex_analysis import can_match_newline, update_dotall
+
+
+LexerState = tuple[str, ...]
+LineTokens = list[tuple[int, int, _TokenType]]
+
+ROOT_STATE: LexerState = ("root",)
+
+_StepToken = tuple[int, _TokenType, str, LexerState | None]
+
+# A rule of a lexer state, as (match, action, new state, guard). Rules which may examine text after
+# a line break they match have a guard, which matches a prefix of what the rule matches without
+# examining text beyond the line (or beyond the next line containing more than whitespace).
+_Rule = tuple[Callable[..., Any], Any, Any, Callable[..., Any] | None]
+# the rules of lexers, by the id of the token definitions they were derived from
+_rules: dict[int, tuple[dict[str, Any], dict[str, list[_Rule]]]] = {}
+
+# the character classes containing only whitespace
+_WHITESPACE_CATEGORIES = {"CATEGORY_SPACE", "CATEGORY_UNI_SPACE", "CATEGORY_LINEBREAK", "CATEGORY_UNI_LINEBREAK"}
+
+
+def supports_line_states(lexer: Lexer) -> bool:
+    """Whether the lexer's state at a line boundary can be captured and resumed by lex_lines."""
+    return (
+        isinstance(lexer, RegexLexer)
+        and type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed  # type: ignore[comparison-overlap]
+    )
+
+
+def is_known_state(lexer: Lexer, state: LexerState) -> bool:
+    """Whether lex_lines can resume the lexer in the given state, which may have been stored by another process."""
+    # pylint: disable=protected-access
+    return supports_line_states(lexer) and all(name in lexer._tokens for name in state)  # type: ignore[attr-defined]
+
+
+def lex_lines(
+    lexer: Lexer, text: str, state: LexerState = ROOT_STATE, far_positions: list[int] | None = None
+) -> Iterator[tuple[LexerState | None, LineTokens]]:
+    """Lex the text, starting in the given state, and yield the result line by line.
+
+    For every line, yields the lexer state at the start of that line, and the tokens in the line as
+    (column, length, token type) triples. Tokens spanning multiple lines are split at the line
+    breaks. The state is None if the lexer cannot be resumed at the start of that line, e.g.
+    because a token spans the line break, or because the lexer does not support line states.
+
+    Lexing the text before a line depends on the following lines at most as far as whitespace
+    extends into them, and on the first character after it. The exception are rules which failed
+    after examining the text beyond the line they were tried in, e.g. /\\*.*?\\*/ for a comment
+    not (yet) closed. If far_positions is given, the positions at which such rules were tried are
+    appended to it; the lexing of everything after them may depend on all the following text.
+
+    The text is expected to end with a line break; everything after the last one is ignored.
+    """
+    tokens: Iterator[_StepToken]
+    if supports_line_states(lexer):
+        assert isinstance(lexer, RegexLexer)
+        tokens = _lex_regex_with_states(lexer, text, state, [] if far_positions is None else far_positions)
+    else:
+        tokens = ((index, token_type, value, None) for index, token_type, value in lexer.get_tokens_unprocessed(text))
+
+    line_state: LexerState | None = state
+    line_tokens: LineTokens = []
+    line_start = 0
+    line_end = text.find("\n")
+
+    for index, token_type, value, state_after in tokens:
+        token_end = index + len(value)
+        while line_end != -1 and index > line_end:
+            yield line_state, line_tokens
+            line_state, line_tokens = None, []
+            line_start, line_end = line_end + 1, text.find("\n", line_end + 1)
+
+        while line_end != -1 and token_end > line_end:
+            if line_end > index:
+                line_tokens.append((index - line_start, line_end - index, token_type))
+            yield line_state, line_tokens
+            line_state = state_after if token_end == line_end + 1 else None
+            line_tokens = []
+            index = line_start = line_end + 1
+            line_end = text.find("\n", line_start)
+
+        if token_end > index:
+            line_tokens.append((index - line_start, token_end - index, token_type))
+
+    while line_end != -1:
+        yield line_state, line_tokens
+        line_state, line_tokens = None, []
+        line_end = text.find("\n", line_end + 1)
+
+
+def _lex_regex_with_states(
+    lexer: RegexLexer, text: str, stack: LexerState, far_positions: list[int]
+) -> Iterator[_StepToken]:
+    """Replicates RegexLexer.get_tokens_unprocessed, but attaches the state stack after each step.
+
+    The state is attached to the last token emitted by a step if that token ends with a line break
+    where the step ended, so that the lexer can be resumed at the start of the following line.
+    """
+    pos = 0
+    tokendefs = _get_rules(lexer)
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    while True:
+        for rexmatch, action, new_state, guard in statetokens:
+            if guard is not None and not guard(text, pos):
+                # neither can the rule match here
+                continue
+            m = rexmatch(text, pos)
+            if not m and guard is not None:
+                far_positions.append(pos)
+            if m:
+                step_tokens: list[tuple[int, _TokenType, str]]
+                if action is None:
+                    step_tokens = []
+                elif type(action) is _TokenType:  # pylint: disable=unidiomatic-typecheck
+                    step_tokens = [(pos, action, m.group())]
+                else:
+                    step_tokens = list(action(lexer, m))
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    else:
+                        raise ValueError(f"Wrong state definition: {new_state!r}.")
+                    statetokens = tokendefs[statestack[-1]]
+                if step_tokens:
+                    for index, token_type, value in step_tokens[:-1]:
+                        yield index, token_type, value, None
+                    index, token_type, value = step_tokens[-1]
+                    resumable = value.endswith("\n") and index + len(value) == pos
+                    yield index, token_type, value, tuple(statestack) if resumable else None
+                break
+        else:
+            if pos >= len(text):
+                break
+            if text[pos] == "\n":
+                statestack = list(ROOT_STATE)
+                statetokens = tokendefs[statestack[-1]]
+                yield pos, Whitespace, "\n", ROOT_STATE
+            else:
+                yield pos, Error, text[pos], tuple(statestack)
+            pos += 1
+
+
+def _get_rules(lexer: RegexLexer) -> dict[str, list[_Rule]]:
+    """Return the rules of the states of the lexer, with guards for those which may look beyond a line break."""
+    # pylint: disable=protected-access
+    # the token definitions are usually shared by the lexers of a class, but some depend on the options
+    tokendefs = lexer._tokens  # type: ignore[attr-defined]
+    cached = _rules.get(id(tokendefs))
+    if cached is not None and cached[0] is tokendefs:
+        return cached[1]
+
+    rules: dict[str, list[_Rule]] = {}
+    for state, state_rules in tokendefs.items():
+        rules[state] = []
+        for rexmatch, action, new_state in state_rules:
+            pattern: re.Pattern[str] = rexmatch.__self__
+            parsed = _parser.parse(pattern.pattern, pattern.flags)
+            dotall = bool(pattern.flags & re.DOTALL)
+            guard = None
+            if not _is_line_local(parsed, dotall):
+                guard_items = _get_guard(parsed, parsed.state, dotall, whitespace_allowed=True)
+                guard = _compiler.compile(_parser.SubPattern(parsed.state, guard_items), pattern.flags).match
+            rules[state].append((rexmatch, action, new_state, guard))
+    _rules[id(tokendefs)] = (tokendefs, rules)
+    return rules
+
+
+def _is_line_local(sequence: Any, dotall: bool) -> bool:
+    """Whether a parsed regular expression examines nothing after a line break it matches.
+
+    This holds if line breaks are only matched at the end, or by repeating something at the end
+    which itself matches line breaks only at its end, like \\s+.
+    """
+    items = list(sequence)
+    if not items:
+        return True
+    if any(can_match_newline(item, dotall) for item in items[:-1]):
+        return False
+    op, value = items[-1]
+    match str(op):
+        case "LITERAL" | "NOT_LITERAL" | "ANY" | "IN" | "AT":
+            return True
+        case "SUBPATTERN":
+            _, add_flags, del_flags, subsequence = value
+            return _is_line_local(subsequence, update_dotall(dotall, add_flags, del_flags))
+        case "BRANCH":
+            return all(_is_line_local(branch, dotall) for branch in value[1])
+        case "MAX_REPEAT" | "MIN_REPEAT" | "POSSESSIVE_REPEAT":
+            # with at most one repetition required, a repetition after a line break cannot make the match fail
+            minimum, _, subsequence = value
+            return minimum <= 1 and _is_line_local(subsequence, dotall)
+        case "ASSERT" | "ASSERT_NOT":
+            return _is_line_local(value[1], dotall)
+        case "ATOMIC_GROUP":
+            return _is_line_local(value, dotall)
+    return not can_match_newline(items[-1], dotall)
+
+
+def _get_guard(sequence: Any, state: Any, dotall: bool, whitespace_allowed: bool) -> list[tuple[Any, Any]]:
+    """Return the items of a prefix of a parsed regular expression which does not match line breaks.
+
+    The prefix may contain one repetition of whitespace, which may extend over lines; groups and
+    alternatives which may match line breaks are followed into, and for optional items, the
+    prefix is an alternative of the item and what follows it.
+    """
+    guard: list[tuple[Any, Any]] = []
+    items = list(sequence)
+    for index, item in enumerate(items):
+        if not can_match_newline(item, dotall):
+            guard.append(item)
+            continue
+        if whitespace_allowed and _is_whitespace_repetition(item):
+            guard.append(item)
+            whitespace_allowed = False
+            continue
+
+        op, value = item
+        match str(op):
+            case "SUBPATTERN":
+                group, add_flags, del_flags, subsequence = value
+                dotall = update_dotall(dotall, add_flags, del_flags)
+                subguard = _parser.SubPattern(state, _get_guard(subsequence, state, dotall, whitespace_allowed))
+                guard.append((op, (group, add_flags, del_flags, subguard)))
+            case "BRANCH":
+                branches = [
+                    _parser.SubPattern(state, _get_guard(branch, state, dotall, whitespace_allowed))
+                    for branch in value[1]
+                ]
+                guard.append((op, (value[0], branches)))
+            case "MAX_REPEAT" | "MIN_REPEAT" | "POSSESSIVE_REPEAT" if value[0] == 0:
+                branches = [
+                    _parser.SubPattern(state, _get_guard(value[2], state, dotall, whitespace_allowed)),
+                    _parser.SubPattern(state, _get_guard(items[index + 1 :], state, dotall, whitespace_allowed)),
+                ]
+                guard.append((_parser.BRANCH, (None, branches)))
+        break
+    return guard
+
+
+def _is_whitespace_repetition(item: tuple[Any, Any]) -> bool:
+    op, value = item
+    match str(op):
+        case "SUBPATTERN":
+            return len(value[3]) == 1 and _is_whitespace_repetition(value[3][0])
+        case "MAX_REPEAT" | "MIN_REPEAT" | "POSSESSIVE_REPEAT":
+            subsequence = list(value[2])
+            return len(subsequence) == 1 and str(subsequence[0][0]) == "IN" and _is_whitespace_class(subsequence[0][1])
+    return False
+
+
+def _is_whitespace_class(items: list[tuple[Any, Any]]) -> bool:
+    for op, value in items:
+        match str(op):
+            case "LITERAL" if chr(value).isspace():
+                pass
+            case "CATEGORY" if str(value) in _WHITESPACE_CATEGORIES:
+                pass
+            case _:
+                return False
+    return True
@@ -1,70 +1,401 @@
-from collections import defaultdict
+from array import array
+import bisect
+import copy
+import itertools
 import logging
+import threading
+from typing import Mapping, Sequence
 
 import pygments.lexers
-from pygments.token import Token, _TokenType
+from pygments.token import _TokenType
+from pygments.util import ClassNotFound
 
 from pte import colors
-from pte.documents import Document
-from pte.highlight import Highlight
+from pte.background import DebouncedWorker
+from pte.documents import Document, DocumentChange
+from pte.highlight import NO_HIGHLIGHTS, PackedHighlights
+
+from .color_scheme import DEFAULT_COLOR_SCHEME, ColorScheme
+from .highlight_cache import CacheEntry, HighlightCache, get_content_hash
+from .lexer_selection import select_lexer
+from .line_lexer import ROOT_STATE, LexerState, LineTokens, is_known_state, lex_lines
 
 
 log = logging.getLogger(__name__)
 
 
-_TOKENTYPE_COLOR_MAP = {
-    Token.Comment: colors.GRAY,
-    Token.Keyword: colors.BLUE,
-    Token.Literal.Number: colors.CYAN,
-    Token.Literal.String.Affix: colors.YELLOW,
-    Token.Literal.String.Interpol: colors.YELLOW,
-    Token.Literal.String: colors.GREEN,
-    Token.Name.Builtin: colors.BLUE,
-    Token.Name.Class: colors.BRIGHT_YELLOW,
-    Token.Name.Function: colors.MAGENTA,
-    Token.Operator.Word: colors.BLUE,
-}
+class PygmentsHighlighter:
+    """Highlights a document using a Pygments lexer, lazily and incrementally.
 
+    The document is only lexed from the top up to the end of the range most recently requested
+    via prepare() (plus a prefetch margin); all lines below remain unlexed until they are needed.
 
-def _get_color_for_token_type(token_type: _TokenType) -> colors.Color | None:
-    for token_family, color in _TOKENTYPE_COLOR_MAP.items():
-        if token_type in token_family:
-            return color
-    return None
+    In background mode, which is used by default for large documents, lexing happens in a worker
+    thread on a snapshot of the document, and the results are picked up by poll(). Until then, the
+    previous highlights are kept; results for outdated snapshots are discarded.
 
+    Given a cache, the lexer and the results for the first lines of the file are taken from there
+    if the file is unchanged since it was last closed (see store_in_cache()). The lexer is trusted
+    by file name, size and modification time; the results only once the lines they are for are
+    available (which may take a while for large files) and match the hash of those lines.
+    """
 
-class PygmentsHighlighter:
-    def __init__(self, document: Document, syntax_name: str | None = None) -> None:
+    _PREFETCH_LINES = 100
+    _BACKGROUND_THRESHOLD = 10_000
+    _BACKGROUND_DEBOUNCE = 0.05
+    # Number of lines at the start of the document used to choose the lexer.
+    _GUESS_LINES = 1000
+    # Number of changes between two frames beyond which the changes are no longer applied one by
+    # one, but the document is lexed anew (e.g. after a replacement in many lines).
+    _MAX_INCREMENTAL_CHANGES = 100
+    # Number of lines at most whose results are stored in the cache.
+    _MAX_CACHED_LINES = 100_000
+
+    def __init__(
+        self,
+        document: Document,
+        syntax_name: str | None = None,
+        *,
+        background: bool | None = None,
+        color_scheme: ColorScheme = DEFAULT_COLOR_SCHEME,
+        cache: HighlightCache | None = None,
+    ) -> None:
         self._document = document
-        self._highlights: defaultdict[int, list[Highlight]] = defaultdict(list)
+        self._cache = cache
+        # the cached results not yet adopted (or rejected)
+        self._cached: CacheEntry | None = None
+        if cache is not None and syntax_name is None and document.path is not None:
+            self._cached = cache.load(document.path)
+            if self._cached is not None and (
+                self._cached.pygments_version != pygments.__version__
+                or self._cached.color_scheme != color_scheme.fingerprint
+            ):
+                self._cached = None
 
         self._lexer: pygments.lexer.Lexer
+        if syntax_name is None and self._cached is not None:
+            try:
+                self._lexer = pygments.lexers.get_lexer_by_name(self._cached.lexer_name)
+            except ClassNotFound:
+                log.warning("Discarding cached highlights, as there is no lexer '%s'.", self._cached.lexer_name)
+                self._cached = None
+            else:
+                log.info("Chose cached lexer with name '%s'.", self._lexer.name)  # type: ignore[attr-defined]
         if syntax_name is not None:
             self._lexer = pygments.lexers.get_lexer_by_name(syntax_name)
-            log.info(f"Chose lexer with name '{self._lexer.name}'.")  # type: ignore[attr-defined]
+            log.info("Chose lexer with name '%s'.", self._lexer.name)  # type: ignore[attr-defined]
+        elif self._cached is None:
+            self._lexer = select_lexer(document.path, document.get_lines(0, self._GUESS_LINES))
+
+        color_scheme.prepare_for(self._lexer)
+        self._color_scheme = color_scheme
+        self._lexed = _LexedLines(self._lexer, color_scheme, document)
+        # the document version the highlights correspond to
+        self._version = document.version
+        self._requested_end = 0
+        self._unprepared_changes = 0
+        self._outdated = False
+
+        if background is None:
+            background = document.number_of_lines() >= self._BACKGROUND_THRESHOLD
+        self._worker: DebouncedWorker[_LexedLines] | None = None
+        if background:
+            self._worker = DebouncedWorker(f"{type(self).__name__} worker", self._BACKGROUND_DEBOUNCE)
+            # the changes not yet processed by the worker; a document stands for a new snapshot
+            self._pending_changes: list[DocumentChange | Document] = []
+            self._pending_changes_lock = threading.Lock()
+            # the most recent result of the worker, which subsequent jobs build upon
+            self._worker_lexed = self._lexed
+            self._reset()
+        else:
+            self._adopt_cached(self._lexed)
+
+    def update(self, change: DocumentChange | None = None) -> None:
+        if change is None:
+            if self._version != self._document.version:
+                self._reset()
+            return
+
+        self._version = change.version
+        if self._outdated:
+            return
+        self._unprepared_changes += 1
+        if self._unprepared_changes > self._MAX_INCREMENTAL_CHANGES:
+            log.debug("More than %d changes at once, lexing anew.", self._MAX_INCREMENTAL_CHANGES)
+            self._outdated = True
+            return
+
+        if self._worker:
+            with self._pending_changes_lock:
+                self._pending_changes.append(change)
+            self._submit()
+        else:
+            self._lexed.apply(change)
+
+    def prepare(self, first_line: int, end_line: int) -> None:
+        self._unprepared_changes = 0
+        if self._outdated:
+            self._outdated = False
+            self._reset()
+
+        end_line = min(self._document.number_of_lines(), end_line + self._PREFETCH_LINES)
+        if self._lexed.lexed_end >= end_line or (self._worker and self._requested_end >= end_line):
+            return
+        self._requested_end = end_line
+        if self._worker:
+            self._submit()
+        else:
+            self._lexed.extend(end_line)
+
+    def poll(self) -> None:
+        if not self._worker or not (result := self._worker.take_result()):
+            return
+        version, lexed = result
+        if version == self._version:
+            self._lexed = lexed
+        else:
+            log.debug("Discarding highlights for version %d (current version: %d).", version, self._version)
+
+    def get_highlights(self, line: int) -> PackedHighlights:
+        return self._lexed.get_highlights(line)
+
+    def _reset(self) -> None:
+        self._version = self._document.version
+        if self._worker:
+            with self._pending_changes_lock:
+                self._pending_changes = [self._document.snapshot()]
+            self._submit()
         else:
-            self._lexer = pygments.lexers.guess_lexer(document.text)
-            log.info(f"Guessed lexer with name '{self._lexer.name}'.")  # type: ignore[attr-defined]
+            self._lexed = _LexedLines(self._lexer, self._color_scheme, self._document)
 
-    def update(self) -> None:
-        code = self._document.text
-        tokens = self._lexer.get_tokens_unprocessed(code)
-        self._highlights.clear()
+    def _submit(self) -> None:
+        assert self._worker
+        end_line = self._requested_end
 
-        for index, token_type, value in tokens:
-            color = _get_color_for_token_type(token_type)
-            if not color:
-                continue
+        def job() -> _LexedLines:
+            with self._pending_changes_lock:
+                changes, self._pending_changes = self._pending_changes, []
 
-            line, column = self._document.get_coordinates(index)
+            lexed = copy.copy(self._worker_lexed)
+            for change in changes:
+                if isinstance(change, Document):
+                    lexed = _LexedLines(self._lexer, self._color_scheme, change)
+                elif change.first_line == lexed.lines.number_of_lines() and not change.old_lines:
+                    # appended lines (e.g. of a file still being loaded) are only read once they are lexed
+                    lexed.lines.append_lines(change.new_lines)
+                else:
+                    lexed.lines.replace_lines(change.first_line, change.old_end, list(change.new_lines))
+                    lexed.apply(change)
+            self._adopt_cached(lexed)
+            lexed.extend(end_line)
 
-            highlight = Highlight(column, len(value), color)
-            self._highlights[line].append(highlight)
+            self._worker_lexed = lexed
+            return lexed
 
-        log.debug(f"Number of highlights: {sum(map(len, self._highlights.values()))}.")
+        self._worker.submit(self._version, job)
 
-    def get_highlights(self, line: int) -> list[Highlight]:
-        return self._highlights.get(line, [])
+    def store_in_cache(self) -> None:
+        """Store the lexer and the results for the lexed lines in the cache, to be reused for the same file."""
+        if self._cache is None or self._document.path is None or not self._lexer.aliases:
+            return
+        if self._outdated or (self._worker and self._worker.busy):
+            # the results do not match any version of the document
+            return
+        lexed = self._lexed
+        end = min(lexed.lexed_end, self._MAX_CACHED_LINES)
+        entry = CacheEntry(
+            pygments.__version__,
+            self._lexer.aliases[0],
+            self._color_scheme.fingerprint,
+            get_content_hash(lexed.lines.get_lines(0, end)),
+            *lexed.get_results(end),
+        )
+        self._cache.store(self._document.path, entry)
+
+    def _adopt_cached(self, lexed: "_LexedLines") -> None:
+        """Adopt the cached results once the lines they are for are available, if they match these lines."""
+        cached = self._cached
+        if cached is None:
+            return
+        end = len(cached.states)
+        if lexed.lines.number_of_lines() < end and lexed.lines is not self._document:
+            # the lines of a file still being loaded
+            return
+        self._cached = None
+        if get_content_hash(lexed.lines.get_lines(0, end)) != cached.content_hash:
+            log.info("Discarding cached highlights, as the lines have changed.")
+        elif not all(state is None or is_known_state(self._lexer, state) for state in cached.states):
+            log.warning("Discarding cached highlights, as the lexer does not know their states.")
+        else:
+            try:
+                lexed.restore(cached.states, cached.highlights, cached.far_lines)
+            except (ValueError, TypeError) as exc:
+                log.warning("Discarding invalid cached highlights: %s.", exc)
 
     def __str__(self) -> str:
         return f"{type(self).__name__} with lexer '{self._lexer.name}'"  # type: ignore[attr-defined]
+
+
+class _LexedLines:
+    """The lexing results for a prefix of the lines of a document.
+
+    For each lexed line, the highlights and the lexer state at the start of the line are kept. The
+    state serves as checkpoint (if the lexer can be resumed there): After an edit, lexing restarts
+    at the nearest checkpoint which does not depend on the changed lines, and stops as soon as the
+    lexer state after the changed lines matches the checkpoint of the previous run; the highlights
+    of all further lines are kept.
+
+    A checkpoint depends on the text up to the next line containing more than whitespace, and, if
+    the lexer tried a rule there which may have examined all of the following text (see
+    lex_lines()), on all the text after such a far line. The far lines are kept for that reason.
+
+    All updates replace the lists instead of modifying them, so that the results of a shallow copy
+    can be updated independently of the original. The document is shared, though.
+    """
+
+    # Number of lines lexed beyond the end of a range and then discarded, so that tokens spanning
+    # multiple lines are not cut off at the end of the range.
+    _LOOKAHEAD_LINES = 20
+
+    def __init__(self, lexer: pygments.lexer.Lexer, color_scheme: ColorScheme, lines: Document) -> None:
+        self._lexer = lexer
+        self._color_table = color_scheme.table
+        self.lines = lines
+        self._highlights: list[PackedHighlights] = []
+        self._states: list[LexerState | None] = []
+        # the lines in which the lexer tried rules which may have examined all of the following text, sorted
+        self._far_lines: list[int] = []
+
+    @property
+    def lexed_end(self) -> int:
+        return len(self._states)
+
+    def get_highlights(self, line: int) -> PackedHighlights:
+        if line < len(self._highlights):
+            return self._highlights[line]
+        return NO_HIGHLIGHTS
+
+    def get_results(self, end: int) -> tuple[list[LexerState | None], list[bytes], list[int]]:
+        """Return the lexer states, the highlights (as bytes) and the far lines of the lines up to end."""
+        return (
+            self._states[:end],
+            [highlights.tobytes() for highlights in self._highlights[:end]],
+            self._far_lines[: bisect.bisect_left(self._far_lines, end)],
+        )
+
+    def restore(
+        self, states: Sequence[LexerState | None], highlights: Sequence[bytes], far_lines: Sequence[int]
+    ) -> None:
+        """Adopt the results of an earlier run for the first lines, unless more lines are lexed already.
+
+        The lines must not have changed since.
+        """
+        if len(states) <= len(self._states):
+            return
+        if len(highlights) != len(states):
+            raise ValueError(f"{len(highlights)} lines of highlights for {len(states)} lexer states")
+        if list(far_lines) != sorted(far_lines) or any(not 0 <= line < len(states) for line in far_lines):
+            raise ValueError("far lines out of order or range")
+        self._highlights = [_highlights_from_bytes(line) for line in highlights]
+        self._states = list(states)
+        self._far_lines = list(far_lines)
+
+    def apply(self, change: DocumentChange) -> None:
+        """Update the results after the given change was applied to the lines."""
+        lexed_end = len(self._states)
+        if change.first_line >= lexed_end:
+            return
+
+        # re-lex the changed lines, and at most up to the end of the previously lexed lines
+        self._lex(
+            change.first_line,
+            max(change.first_line, lexed_end + change.line_shift),
+            converge_from=(change.new_end, change.line_shift),
+        )
+
+    def extend(self, end: int) -> None:
+        end = min(end, self.lines.number_of_lines())
+        if len(self._states) < end:
+            self._lex(len(self._states), end)
+
+    def _lex(self, start: int, end: int, *, converge_from: tuple[int, int] | None = None) -> None:
+        """Lex the lines from the nearest checkpoint not depending on the lines from start on, up to end.
+
+        If converge_from is given as the end of the changed lines and the shift in line numbers
+        since the last update, stop early once the lexer state matches the previous run.
+        """
+        restart = self._get_restart_line(start)
+        restart_state = self._states[restart] if restart else ROOT_STATE
+        assert restart_state is not None
+
+        new_highlights: list[PackedHighlights] = []
+        new_states: list[LexerState | None] = []
+        tail_start: int | None = None
+        far_positions: list[int] = []
+
+        lines = self.lines.get_lines(restart, end + self._LOOKAHEAD_LINES)
+        code = "\n".join(lines) + "\n"
+        for line, (state, tokens) in enumerate(lex_lines(self._lexer, code, restart_state, far_positions), restart):
+            if converge_from is not None:
+                changed_end, shift = converge_from
+                old_line = line - shift
+                if (
+                    line >= changed_end
+                    and state is not None
+                    and old_line < len(self._states)
+                    and state == self._states[old_line]
+                ):
+                    tail_start = old_line
+                    break
+            if line >= end:
+                break
+            new_states.append(state)
+            new_highlights.append(_get_highlights(tokens, self._color_table))
+
+        new_end = restart + len(new_states)
+        far_lines = self._far_lines[: bisect.bisect_left(self._far_lines, restart)]
+        if far_positions:
+            line_ends = list(itertools.accumulate(len(line) + 1 for line in lines))
+            far_lines += sorted({restart + bisect.bisect_right(line_ends, position) for position in far_positions})
+            far_lines = [line for line in far_lines if line < new_end]
+        if tail_start is None:
+            self._states = self._states[:restart] + new_states
+            self._highlights = self._highlights[:restart] + new_highlights
+        else:
+            self._states = self._states[:restart] + new_states + self._states[tail_start:]
+            self._highlights = self._highlights[:restart] + new_highlights + self._highlights[tail_start:]
+            first_tail_far_line = bisect.bisect_left(self._far_lines, tail_start)
+            far_lines += [line - tail_start + new_end for line in self._far_lines[first_tail_far_line:]]
+        self._far_lines = far_lines
+
+        log.debug("Lexed lines %d to %d of %d.", restart, new_end, self.lines.number_of_lines())
+
+    def _get_restart_line(self, start: int) -> int:
+        """Return the last line with a checkpoint not depending on the lines from start on, or 0."""
+        restart = min(start - 1, len(self._states) - 1)
+        # whitespace may have been matched up to the first character of the next line with more than whitespace
+        while restart > 0 and not self.lines.get_line(restart).strip():
+            restart -= 1
+        if self._far_lines and self._far_lines[0] < start:
+            restart = min(restart, self._far_lines[0])
+        while restart > 0 and self._states[restart] is None:
+            restart -= 1
+        return max(restart, 0)
+
+
+def _get_highlights(tokens: LineTokens, color_table: Mapping[_TokenType, colors.Color | None]) -> PackedHighlights:
+    values: list[int] = []
+    for column, length, token_type in tokens:
+        color = color_table[token_type]
+        if color:
+            values += (column, length, color)
+    # lines without highlights share one array
+    return array("I", values) if values else NO_HIGHLIGHTS
+
+
+def _highlights_from_bytes(data: bytes) -> PackedHighlights:
+    if not data:
+        return NO_HIGHLIGHTS
+    highlights = array("I")
+    highlights.frombytes(data)
+    return highlights
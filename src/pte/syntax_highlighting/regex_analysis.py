@@ -0,0 +1,74 @@
+import re
+from re import _parser  # type: ignore[attr-defined]
+from typing import Any, Pattern
+
+
+# the character classes containing line breaks
+_NEWLINE_CATEGORIES = {
+    "CATEGORY_SPACE",
+    "CATEGORY_NOT_DIGIT",
+    "CATEGORY_NOT_WORD",
+    "CATEGORY_LINEBREAK",
+    "CATEGORY_LOC_NOT_WORD",
+    "CATEGORY_UNI_SPACE",
+    "CATEGORY_UNI_NOT_DIGIT",
+    "CATEGORY_UNI_NOT_WORD",
+    "CATEGORY_UNI_LINEBREAK",
+}
+
+
+def can_match_line_break(pattern: Pattern[str]) -> bool:
+    """Whether the pattern may match text containing a line break."""
+    dotall = bool(pattern.flags & re.DOTALL)
+    return any(can_match_newline(item, dotall) for item in _parser.parse(pattern.pattern, pattern.flags))
+
+
+def can_match_newline(item: tuple[Any, Any], dotall: bool) -> bool:
+    """Whether an item of a parsed regular expression may match a line break, if . matches any character or not."""
+    op, value = item
+    match str(op):
+        case "LITERAL":
+            return bool(value == 10)
+        case "NOT_LITERAL":
+            return bool(value != 10)
+        case "ANY":
+            return dotall
+        case "IN":
+            return _class_contains_newline(value)
+        case "AT":
+            return False
+        case "SUBPATTERN":
+            _, add_flags, del_flags, subsequence = value
+            dotall = update_dotall(dotall, add_flags, del_flags)
+            return any(can_match_newline(subitem, dotall) for subitem in subsequence)
+        case "BRANCH":
+            return any(can_match_newline(subitem, dotall) for branch in value[1] for subitem in branch)
+        case "MAX_REPEAT" | "MIN_REPEAT" | "POSSESSIVE_REPEAT":
+            return any(can_match_newline(subitem, dotall) for subitem in value[2])
+        case "ASSERT" | "ASSERT_NOT":
+            return any(can_match_newline(subitem, dotall) for subitem in value[1])
+        case "ATOMIC_GROUP":
+            return any(can_match_newline(subitem, dotall) for subitem in value)
+    # e.g. back references, which may match anything
+    return True
+
+
+def _class_contains_newline(items: list[tuple[Any, Any]]) -> bool:
+    negated = bool(items) and str(items[0][0]) == "NEGATE"
+    contained = False
+    for op, value in items[1:] if negated else items:
+        match str(op):
+            case "LITERAL":
+                contained = contained or value == 10
+            case "RANGE":
+                contained = contained or value[0] <= 10 <= value[1]
+            case "CATEGORY":
+                contained = contained or str(value) in _NEWLINE_CATEGORIES
+            case _:
+                contained = True
+    return contained != negated
+
+
+def update_dotall(dotall: bool, add_flags: int, del_flags: int) -> bool:
+    """Whether . matches line breaks within a group with the given flags."""
+    return bool(add_flags & re.DOTALL) or (dotall and not del_flags & re.DOTALL)
@@ -1,54 +1,229 @@
+from itertools import count
 import logging
 import re
-from typing import Pattern
+from typing import Callable, Pattern
 
 from pte import colors
-from pte.documents import DocumentBuffer
-from pte.highlight import Highlight
+from pte.background import DebouncedWorker, SubprocessJob
+from pte.documents import DocumentBuffer, DocumentChange
+from pte.highlight import NO_HIGHLIGHTS, Highlight, PackedHighlights, pack, unpack
+
+from .regex_analysis import can_match_line_break
 
 
 log = logging.getLogger(__name__)
 
 
+# the scan state of a line
+_UNKNOWN = 0
+_NO_MATCH = 1
+_MATCH = 2
+# maps matching lines back to unknown, keeping the lines known not to match
+_FORGET_MATCHES = bytes([_UNKNOWN, _NO_MATCH, _UNKNOWN]).ljust(256, b"\0")
+_LINE_TO_SEARCH = re.compile(b"[^%c]" % _NO_MATCH)
+
+# the line states, the highlights of the scanned lines, and the next match
+_SearchResult = tuple[bytearray, dict[int, PackedHighlights], tuple[int, Highlight] | None]
+
+_job_ids = count()
+
+
 class RegexHighlighter:
-    def __init__(self, document_buffer: DocumentBuffer, pattern: str) -> None:
+    """Highlights all matches of a pattern, as well as the next match after the cursor.
+
+    Matching happens in a child process (see SubprocessJob), which is started once no new pattern
+    was requested for _DEBOUNCE seconds, and killed as soon as the highlighter is cancelled (e.g.
+    because it is replaced by one for the next pattern). So no pattern can block the input, however
+    slow it is to match. Until the results are picked up by poll(), the previous highlights stay.
+
+    Only the prepared (i.e. visible) lines are scanned for matches, and the next match is searched
+    line by line from the cursor on. If the pattern is a literal string containing the literal
+    pattern of the previous highlighter (e.g. while it is typed), the lines in which the previous
+    pattern did not match are skipped. Matches spanning multiple lines are not highlighted, but if
+    the pattern can match a line break, the next match is searched in the text of the whole
+    document instead, so that they are found.
+    """
+
+    _DEBOUNCE = 0.05
+    _TIMEOUT = 10.0
+
+    def __init__(
+        self, document_buffer: DocumentBuffer, pattern: str, *, previous: "RegexHighlighter | None" = None
+    ) -> None:
         self._document_buffer = document_buffer
-        self._highlights: list[list[Highlight]] = []
+        self._pattern_string = pattern
 
         self._pattern: Pattern[str] | None
         try:
             self._pattern = re.compile(pattern)
         except re.error:
-            log.debug(f"Not a valid regular expression: '{pattern}'.")
+            log.debug("Not a valid regular expression: '%s'.", pattern)
             self._pattern = None
+        self._multiline = self._pattern is not None and can_match_line_break(self._pattern)
 
-    def update(self) -> None:
-        if not self._pattern:
-            self._highlights = [[] for _ in self._document_buffer.document]
-            log.debug("Pattern is None. No highlights computed.")
-            return
+        self._version = -1
+        self._line_states = bytearray()
+        # the highlights of the scanned lines, and those shown until the results of a scan are adopted
+        self._matches: dict[int, PackedHighlights] = {}
+        self._highlights: dict[int, PackedHighlights] = {}
+        if previous is not None and self._is_refinement_of(previous):
+            self._version = previous._version
+            self._line_states = previous._line_states.translate(_FORGET_MATCHES)
+            log.debug("Refining the matches of '%s' to '%s'.", previous._pattern_string, pattern)
+
+        # the search for the next match after the cursor
+        self._cursor = (0, 0)
+        self._next_match: tuple[int, Highlight] | None = None
+        self._searched = False
+
+        self._worker: DebouncedWorker[_SearchResult | None] = (
+            previous._worker if previous is not None else DebouncedWorker("Search preview", self._DEBOUNCE)
+        )
+        self._job: SubprocessJob[_SearchResult] | None = None
+        self._job_id = -1
+        self._requested_range: tuple[int, int] | None = None
 
+    def update(self, change: DocumentChange | None = None) -> None:
         document = self._document_buffer.document
+        if self._version != document.version:
+            self._version = document.version
+            self._line_states = bytearray(document.number_of_lines())
+            self._matches = {}
+
         cursor = self._document_buffer.cursor
+        self._cursor = (cursor.line, cursor.column)
+        self._searched = False
+        self._requested_range = None
+
+    def prepare(self, first_line: int, end_line: int) -> None:
+        if not self._pattern or self._requested_range == (first_line, end_line):
+            return
+        self._requested_range = (first_line, end_line)
+        self._submit(first_line, end_line)
+
+    def poll(self) -> None:
+        result = self._worker.take_result()
+        if result is None:
+            return
+        job_id, search_result = result
+        if job_id == self._job_id and search_result is not None:
+            self._adopt(search_result)
+
+    @property
+    def pattern(self) -> str:
+        return self._pattern_string
+
+    def find_next_match(self, timeout: float | None = None) -> tuple[int, int] | None:
+        """Return the position of the next match after the cursor.
+
+        Unless the background search has already finished, search right away, for at most timeout seconds.
+        """
+        self.poll()
+        if not self._searched and self._pattern:
+            self.cancel()
+            search_result = SubprocessJob(f"search for '{self._pattern_string}'", self._get_search(0, 0)).run(timeout)
+            if search_result is None:
+                return None
+            self._adopt(search_result)
+        if self._next_match is None:
+            return None
+        line, highlight = self._next_match
+        return line, highlight.column
+
+    def cancel(self) -> None:
+        """Abandon the search in progress, if any."""
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def get_highlights(self, line: int) -> PackedHighlights:
+        highlights = self._highlights.get(line, NO_HIGHLIGHTS)
+        if self._next_match and self._next_match[0] == line:
+            # the next match takes the place of its highlight among all matches, keeping them sorted
+            next_match = self._next_match[1]
+            others = [Highlight(*highlight) for highlight in unpack(highlights) if highlight[0] != next_match.column]
+            highlights = pack(sorted([*others, next_match], key=lambda highlight: highlight.column))
+        return highlights
+
+    def _submit(self, first_line: int, end_line: int) -> None:
+        self.cancel()
+        job = SubprocessJob(f"search for '{self._pattern_string}'", self._get_search(first_line, end_line))
+        self._job = job
+        self._job_id = next(_job_ids)
+        self._worker.submit(self._job_id, lambda: job.run(self._TIMEOUT))
+
+    def _get_search(self, first_line: int, end_line: int) -> Callable[[], _SearchResult]:
+        def search() -> _SearchResult:
+            # runs in the child process, so that modifying self has no effect on the parent
+            for line in range(first_line, min(end_line, len(self._line_states))):
+                self._scan(line)
+            self._search_next_match()
+            return self._line_states, self._matches, self._next_match
+
+        return search
+
+    def _adopt(self, search_result: _SearchResult) -> None:
+        self._line_states, self._matches, self._next_match = search_result
+        self._highlights = self._matches
+        self._searched = True
+
+    def _scan(self, line: int) -> PackedHighlights:
+        state = self._line_states[line]
+        if state == _NO_MATCH:
+            return NO_HIGHLIGHTS
+        if state == _MATCH:
+            return self._matches[line]
+
+        assert self._pattern
+        highlights = pack(
+            Highlight(match.start(), match.end() - match.start(), colors.BLACK_ON_YELLOW)
+            for match in self._pattern.finditer(self._document_buffer.document.get_line(line))
+        )
+        if highlights:
+            self._line_states[line] = _MATCH
+            self._matches[line] = highlights
+        else:
+            self._line_states[line] = _NO_MATCH
+        return highlights
+
+    def _search_next_match(self) -> None:
+        self._next_match = None
+        if self._multiline:
+            self._search_next_match_in_text()
+            return
+
+        cursor_line, cursor_column = self._cursor
+        number_of_lines = len(self._line_states)
+        line = cursor_line
+        while line < number_of_lines:
+            for column, length, _ in unpack(self._scan(line)):
+                if line > cursor_line or column > cursor_column:
+                    self._next_match = (line, Highlight(column, length, colors.BLACK_ON_GREEN))
+                    return
+
+            # skip the lines known not to match
+            next_line = _LINE_TO_SEARCH.search(self._line_states, line + 1)
+            line = next_line.start() if next_line else number_of_lines
+
+    def _search_next_match_in_text(self) -> None:
+        assert self._pattern
+        document = self._document_buffer.document
+        match = self._pattern.search(document.text, document.get_index(*self._cursor) + 1)
+        if match:
+            line, column = document.get_coordinates(match.start())
+            # only the part of the match in its first line is highlighted
+            length = min(match.end(), document.get_index(line, document.get_line_length(line))) - match.start()
+            self._next_match = (line, Highlight(column, length, colors.BLACK_ON_GREEN))
+
+    def _is_refinement_of(self, previous: "RegexHighlighter") -> bool:
+        return (
+            previous._document_buffer is self._document_buffer
+            and previous._version == self._document_buffer.document.version
+            and _is_literal(previous._pattern_string)
+            and _is_literal(self._pattern_string)
+            and previous._pattern_string in self._pattern_string
+        )
+
 
-        self._highlights = [
-            [
-                Highlight(match.start(0), match.end(0) - match.start(0), colors.BLACK_ON_YELLOW)
-                for match in self._pattern.finditer(line)
-            ]
-            for line in document
-        ]
-
-        cursor_position = document.get_index(cursor.line, cursor.column)
-        next_match = self._pattern.search(document.text, cursor_position + 1)
-        if next_match:
-            next_match_index = next_match.start()
-            line, column = document.get_coordinates(next_match_index)
-            self._highlights[line].append(
-                Highlight(column, next_match.end() - next_match.start(), colors.BLACK_ON_GREEN)
-            )
-
-        log.debug(f"Number of highlights: {sum(map(len, self._highlights))}.")
-
-    def get_highlights(self, line: int) -> list[Highlight]:
-        return self._highlights[line]
+def _is_literal(pattern: str) -> bool:
+    return re.escape(pattern) == pattern
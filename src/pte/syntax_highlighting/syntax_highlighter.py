@@ -1,19 +1,42 @@
+from typing import TYPE_CHECKING
+
 from typing_extensions import Protocol
 
-from pte.highlight import Highlight
+from pte.highlight import NO_HIGHLIGHTS, PackedHighlights
+
+
+if TYPE_CHECKING:
+    # not imported at runtime, as pte.documents imports this module
+    from pte.documents import DocumentChange
 
 
 class SyntaxHighlighter(Protocol):
-    def update(self) -> None:
-        ...
+    def update(self, change: "DocumentChange | None" = None) -> None:
+        """Update the highlights after the given change, or after unknown changes if change is None."""
+
+    def prepare(self, first_line: int, end_line: int) -> None:
+        """Make sure the highlights for the lines first_line, ..., end_line - 1 are available.
+
+        Highlighters may compute highlights lazily, and are only required to provide highlights for
+        the lines of the range most recently prepared.
+        """
 
-    def get_highlights(self, line: int) -> list[Highlight]:
+    def poll(self) -> None:
+        """Pick up highlights computed in the background, if any."""
+
+    def get_highlights(self, line: int) -> PackedHighlights:
         ...
 
 
 class NoOpHighlighter:
-    def update(self) -> None:
+    def update(self, change: "DocumentChange | None" = None) -> None:
+        pass
+
+    def prepare(self, first_line: int, end_line: int) -> None:
+        pass
+
+    def poll(self) -> None:
         pass
 
-    def get_highlights(self, line: int) -> list[Highlight]:  # pylint: disable=unused-argument
-        return []
+    def get_highlights(self, line: int) -> PackedHighlights:  # pylint: disable=unused-argument
+        return NO_HIGHLIGHTS
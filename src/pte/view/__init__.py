@@ -1 +1,4 @@
-from .main_view import MainView
+from .curses_screen import CursesScreen
+from .main_view import MainView, PastedText
+from .screen import Screen, Window
+from .virtual_screen import FrameStatistics, VirtualScreen
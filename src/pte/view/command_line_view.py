@@ -1,8 +1,8 @@
-import curses
+from .screen import Window
 
 
 class CommandLineView:
-    def __init__(self, window: curses.window):
+    def __init__(self, window: Window):
         self._window = window
         self.active = False
         self.command = ""
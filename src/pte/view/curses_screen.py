@@ -0,0 +1,91 @@
+import curses
+import os
+import signal
+import sys
+from types import FrameType
+
+from pte import colors, wakeup
+
+from .screen import Window
+
+
+class CursesScreen:
+    """The terminal, as set up by curses."""
+
+    def __init__(self, window: curses.window) -> None:
+        self._window = window
+        self._window.timeout(0)
+        self._resize_pending = False
+        signal.signal(signal.SIGWINCH, self._on_resize_signal)
+
+        curses.set_escdelay(1)
+        curses.use_default_colors()
+        for fg in range(16):
+            curses.init_pair(fg + 1, fg, -1)
+        for bg in range(8):
+            curses.init_pair(bg + 17, -1, bg)
+        for bg in range(8):
+            curses.init_pair(bg + 25, 0, bg)
+
+    @property
+    def window(self) -> Window:
+        return self._window
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self._window.getmaxyx()
+
+    def create_window(self, height: int, width: int, y: int, x: int) -> Window:
+        return self._window.derwin(height, width, y, x)
+
+    def get_attribute(self, color: colors.Color, *, reverse: bool = False, bold: bool = False) -> int:
+        attributes = curses.color_pair(color)
+        if reverse:
+            attributes |= curses.A_REVERSE
+        if bold:
+            attributes |= curses.A_BOLD
+        return attributes
+
+    def set_cursor(self, y: int, x: int) -> None:
+        curses.setsyx(y, x)
+
+    def show_cursor(self, visible: bool) -> None:
+        curses.curs_set(1 if visible else 0)
+
+    def update(self) -> None:
+        curses.doupdate()
+
+    def write(self, sequence: str) -> None:
+        sys.__stdout__.write(sequence)
+        sys.__stdout__.flush()
+
+    def get_key(self) -> str:
+        if self._resize_pending:
+            self._resize_pending = False
+            size = os.get_terminal_size(sys.__stdout__.fileno())
+            curses.resizeterm(size.lines, size.columns)
+            return "KEY_RESIZE"
+        try:
+            return self._window.getkey()
+        except curses.error:
+            return ""
+
+    def get_character(self, timeout: int) -> str | None:
+        self._window.timeout(timeout)
+        try:
+            while True:
+                character = self._window.get_wch()
+                # skip function keys
+                if isinstance(character, str):
+                    return character
+        except curses.error:
+            return None
+        finally:
+            self._window.timeout(0)
+
+    def fileno(self) -> int | None:
+        return sys.stdin.fileno()
+
+    def _on_resize_signal(self, signum: int, frame: FrameType | None) -> None:  # pylint: disable=unused-argument
+        self._resize_pending = True
+        wakeup.notify()
@@ -1,20 +1,34 @@
 import curses
 import logging
+import re
 
-from pte.highlight import Highlight
+from pte import colors
+from pte.documents import Document
+from pte.highlight import PackedHighlights
+from pte.syntax_highlighting import SyntaxHighlighter
+
+from .line_composer import compose
+from .screen import Screen, Window
 
 
 log = logging.getLogger(__name__)
 
+_TAB_SIZE = 8
+# characters curses shows as more than one cell: tabs, and other control characters (e.g. ^A)
+_WIDE_CHARACTER = re.compile("[\x00-\x1f\x7f]")
+
 
 class DocumentView:
-    def __init__(self, window: curses.window) -> None:
-        # curses stuff
+    def __init__(self, screen: Screen, window: Window) -> None:
+        self._screen = screen
         self._window = window
 
         # view content
-        self.document: list[str] | None = None
-        self.highlights: list[list[Highlight]] = []
+        self.document: Document | None = None
+        # highlight layers, in increasing order of precedence
+        self.highlighters: list[SyntaxHighlighter] = []
+        # the screen attributes of the colors painted so far
+        self._attributes: dict[colors.Color, int] = {}
 
         # the part of the buffer currently visible on screen, represented by the number of the
         # first visible line, and the the number of the first non-visible line below that.
@@ -24,6 +38,10 @@ class DocumentView:
         self._line: int = 0
         self._column: int = 0
 
+        # what was last painted in each screen line (its text and the highlights of each layer), None for blank lines
+        self._painted_lines: list[tuple[str, tuple[PackedHighlights, ...]] | None] = []
+        self.invalidate()
+
     @property
     def cursor(self) -> tuple[int, int]:
         return (self._line, self._column)
@@ -42,34 +60,74 @@ class DocumentView:
 
     def set_size(self, height: int, width: int) -> None:
         self._window.resize(height, width)
+        self.invalidate()
         self._consolidate_view_parameters()
 
+    def invalidate(self) -> None:
+        """Forget what was painted, and repaint the whole window on the next draw.
+
+        Must be called whenever the window content was changed from outside the view.
+        """
+        self._window.erase()
+        self._painted_lines = [None] * self.window_height
+
     def draw(self) -> None:
         self._consolidate_view_parameters()
-        self._window.erase()
         self._draw_document()
 
     def _draw_document(self) -> None:
+        """Paint the visible part of the document, skipping screen lines that did not change since the last draw."""
         if self.document is None:
+            if any(self._painted_lines):
+                self.invalidate()
             return
 
         first, last = self._buffer_window
 
-        for screen_line_number, buffer_line_number in zip(range(last - first), range(first, last)):
-            line = self.document[buffer_line_number]
-            self._window.addstr(screen_line_number, 0, line)
-
-            line_hls = self.highlights[buffer_line_number] if self.highlights else []
-            for hl in line_hls:
-                self._window.addstr(
-                    screen_line_number,
-                    hl.column,
-                    line[hl.column : hl.column + hl.length],
-                    curses.color_pair(hl.color),
+        for highlighter in self.highlighters:
+            highlighter.prepare(first, last)
+        width = self.window_width
+
+        for screen_line_number in range(self.window_height):
+            buffer_line_number = first + screen_line_number
+            content: tuple[str, tuple[PackedHighlights, ...]] | None = None
+            if buffer_line_number < last:
+                content = (
+                    self.document.get_line(buffer_line_number),
+                    tuple(highlighter.get_highlights(buffer_line_number) for highlighter in self.highlighters),
                 )
 
+            if content == self._painted_lines[screen_line_number]:
+                continue
+            self._painted_lines[screen_line_number] = content
+
+            self._window.move(screen_line_number, 0)
+            self._window.clrtoeol()
+            if content is None:
+                continue
+
+            line, layers = content
+            # clip to the window width, so that long lines do not wrap into the next screen line
+            x = 0
+            for start, end, color in compose(line, _get_fitting_length(line, width), layers):
+                text = line[start:end]
+                self._paint(screen_line_number, x, text, color)
+                x = _get_end_column(text, x)
+
         self._window.noutrefresh()
-        curses.setsyx(self._line - self._buffer_window[0], self._column)
+        self._screen.set_cursor(self._line - self._buffer_window[0], self._column)
+
+    def _paint(self, y: int, x: int, text: str, color: colors.Color) -> None:
+        if not text:
+            return
+        attributes = self._attributes.get(color)
+        if attributes is None:
+            attributes = self._attributes[color] = self._screen.get_attribute(color)
+        try:
+            self._window.addstr(y, x, text, attributes)
+        except curses.error:
+            # writing to the bottom right corner fails after the text has been written
+            pass
 
     def _consolidate_view_parameters(self) -> None:
         """Ensures the consistency of the view parameters with relevant environment parameters.
@@ -92,7 +150,7 @@ class DocumentView:
         If the screen height decreased, shrink the buffer window from the bottom upwards towards
         the cursor as far as possible; then, if needed, from the top downwards towards the cursor.
         """
-        if not self.document:
+        if self.document is None or self.document.is_empty:
             self._line = 0
             self._column = 0
             self._buffer_window = (0, 0)
@@ -102,13 +160,13 @@ class DocumentView:
         buffer_window_height = buffer_window_bottom - buffer_window_top
 
         # shrink buffer window it goes beyond the end of the buffer
-        buffer_window_bottom = min(buffer_window_bottom, len(self.document))
+        buffer_window_bottom = min(buffer_window_bottom, self.document.number_of_lines())
 
         # grow buffer window if possible, shrink buffer window if needed
         available_screen_height = self.window_height
         if buffer_window_height <= available_screen_height:
             # move bottom as far down as possible
-            buffer_window_bottom = min(len(self.document), buffer_window_top + available_screen_height)
+            buffer_window_bottom = min(self.document.number_of_lines(), buffer_window_top + available_screen_height)
             buffer_window_height = buffer_window_bottom - buffer_window_top
             assert 0 <= buffer_window_height <= available_screen_height
 
@@ -157,4 +215,28 @@ class DocumentView:
         available_screen_height = self.window_height
 
         assert 0 <= buffer_window_height <= available_screen_height
-        assert 0 <= buffer_window_top <= self._line < buffer_window_bottom <= len(self.document)
+        assert 0 <= buffer_window_top <= self._line < buffer_window_bottom <= self.document.number_of_lines()
+
+
+def _get_end_column(text: str, column: int) -> int:
+    """Return the screen column after the text, shown by curses from the given column on."""
+    if not _WIDE_CHARACTER.search(text):
+        return column + len(text)
+    for character in text:
+        if character == "\t":
+            column += _TAB_SIZE - column % _TAB_SIZE
+        else:
+            column += 2 if _WIDE_CHARACTER.match(character) else 1
+    return column
+
+
+def _get_fitting_length(line: str, width: int) -> int:
+    """Return the number of characters at the start of the line which curses shows within the width."""
+    if not _WIDE_CHARACTER.search(line, 0, width):
+        return min(len(line), width)
+    column = 0
+    for length, character in enumerate(line):
+        column = _get_end_column(character, column)
+        if column > width:
+            return length
+    return len(line)
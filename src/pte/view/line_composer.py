@@ -0,0 +1,80 @@
+from typing import Sequence
+
+from pte import colors
+from pte.highlight import PackedHighlights, unpack
+
+
+# a part of a line painted in one color, as (start, end, color)
+StyleRun = tuple[int, int, colors.Color]
+
+
+def compose(line: str, length: int, layers: Sequence[PackedHighlights]) -> list[StyleRun]:
+    """Merge the highlight layers of a line into runs covering its first length columns, without gaps or overlaps.
+
+    Where layers overlap, the later layer takes precedence; columns without highlights get the
+    default color. Adjacent runs are merged where they can be painted in one color, so that the line
+    is painted with as few runs as possible.
+    """
+    if length <= 0:
+        return []
+    runs: list[StyleRun] = [(0, length, colors.DEFAULT)]
+    for highlights in layers:
+        if highlights:
+            runs = _overlay(runs, highlights, length)
+
+    merged = [runs[0]]
+    for run in runs[1:]:
+        previous = merged[-1]
+        color = _get_common_color(line, previous, run)
+        if color is None:
+            merged.append(run)
+        else:
+            merged[-1] = (previous[0], run[1], color)
+    return merged
+
+
+def _get_common_color(line: str, first: StyleRun, second: StyleRun) -> colors.Color | None:
+    """Return a color both runs look the same in, if any."""
+    if first[2] == second[2]:
+        return first[2]
+    if colors.has_background(first[2]) or colors.has_background(second[2]):
+        return None
+    # without a background, blank text looks the same in every color
+    if line[second[0] : second[1]].isspace():
+        return first[2]
+    if line[first[0] : first[1]].isspace():
+        return second[2]
+    return None
+
+
+def _overlay(runs: list[StyleRun], highlights: PackedHighlights, length: int) -> list[StyleRun]:
+    """Return the runs with the highlights painted over them.
+
+    The highlights must be sorted by column; where they overlap each other, the earlier one is kept.
+    """
+    result: list[StyleRun] = []
+    position = 0
+    # the first run which may still extend beyond position
+    index = 0
+    for column, highlight_length, color in unpack(highlights):
+        start = max(column, position)
+        end = min(column + highlight_length, length)
+        if start >= end:
+            continue
+        index = _copy(runs, index, position, start, result)
+        result.append((start, end, color))
+        position = end
+    _copy(runs, index, position, length, result)
+    return result
+
+
+def _copy(runs: list[StyleRun], index: int, start: int, end: int, result: list[StyleRun]) -> int:
+    """Append the parts of the runs between start and end to result; return the index of the run containing end."""
+    while index < len(runs) and runs[index][0] < end:
+        run_start, run_end, color = runs[index]
+        if run_end > start and start < end:
+            result.append((max(run_start, start), min(run_end, end), color))
+        if run_end > end:
+            break
+        index += 1
+    return index
@@ -1,69 +1,166 @@
-import curses
+from collections import deque
+import selectors
+import time
 
-from pte import colors
-from pte.highlight import Highlight
+from pte import colors, performance, wakeup
+from pte.documents import Document
+from pte.syntax_highlighting import SyntaxHighlighter
 
 from .command_line_view import CommandLineView
 from .document_view import DocumentView
+from .screen import Screen
 from .status_line_view import StatusLineView
 
 
-class MainView:
-    def __init__(self, window: curses.window):
-        self._window = window
-        self._window.timeout(25)
+ESCAPE = "\x1b"
+# the terminal wraps pasted text in these sequences once bracketed paste is enabled
+ENABLE_BRACKETED_PASTE = "\x1b[?2004h"
+DISABLE_BRACKETED_PASTE = "\x1b[?2004l"
+PASTE_START = "\x1b[200~"
+PASTE_END = "\x1b[201~"
+
 
-        # pylint: disable=no-member
-        document_window = window.derwin(curses.LINES - 2, curses.COLS, 0, 0)
-        status_line_window = window.derwin(1, curses.COLS, curses.LINES - 2, 0)
-        command_line_window = window.derwin(1, curses.COLS, curses.LINES - 1, 0)
+class PastedText(str):
+    """Text pasted into the terminal, which MainView.read() returns at once rather than key by key."""
 
-        self._document_view = DocumentView(document_window)
-        self._status_line_view = StatusLineView(status_line_window)
+
+class MainView:
+    # milliseconds to wait for the rest of a pasted text before giving up on its end marker
+    _PASTE_TIMEOUT = 1000
+
+    def __init__(self, screen: Screen):
+        self._screen = screen
+        self._window = screen.window
+        # keys read ahead of time, e.g. while looking for the start of a paste
+        self._pending_keys: deque[str] = deque()
+        screen.write(ENABLE_BRACKETED_PASTE)
+
+        # wait for input, and for wake-ups from background work or terminal resizes
+        self._selector = selectors.DefaultSelector()
+        if (fileno := screen.fileno()) is not None:
+            self._selector.register(fileno, selectors.EVENT_READ)
+        self._selector.register(wakeup.fileno(), selectors.EVENT_READ)
+
+        lines, columns = screen.size
+        document_window = screen.create_window(lines - 2, columns, 0, 0)
+        status_line_window = screen.create_window(1, columns, lines - 2, 0)
+        command_line_window = screen.create_window(1, columns, lines - 1, 0)
+
+        self._document_view = DocumentView(screen, document_window)
+        self._status_line_view = StatusLineView(screen, status_line_window)
         self._command_line_view = CommandLineView(command_line_window)
 
     def draw(self, *, show_cursor: bool = True, bottom_line_right: str = "") -> None:
+        if performance.show_latency and performance.last_latency is not None:
+            bottom_line_right = f"{performance.last_latency * 1000:.1f}ms {bottom_line_right}"
         self._window.noutrefresh()
         self._status_line_view.draw(bottom_line_right=bottom_line_right)
         self._document_view.draw()
         self._command_line_view.draw()
 
-        curses.curs_set(1 if show_cursor else 0)
+        self._screen.show_cursor(show_cursor)
 
-        curses.doupdate()
+        started = time.perf_counter()
+        self._screen.update()
+        performance.add("paint", started)
 
     def read(self) -> str:
-        try:
-            while (key := self._window.getkey()) == "KEY_RESIZE":
+        """Wait for the next key, and return it.
+
+        Returns an empty string if woken up by something else, such as background work finishing or
+        the terminal being resized, since the screen may need to be redrawn then as well. Pasted
+        text is returned as a single PastedText.
+        """
+        while True:
+            # the screen may already have read pending keys, so ask it before waiting
+            key = self._pending_keys.popleft() if self._pending_keys else self._get_key()
+            if key == "KEY_RESIZE":
+                performance.mark_input(keystroke=False)
                 self.resize()
-        except curses.error:
-            return ""
+                return ""
+            if key:
+                performance.mark_input(keystroke=True)
+                return key
+
+            for selector_key, _ in self._selector.select():
+                if selector_key.fd == wakeup.fileno():
+                    wakeup.clear()
+                    performance.mark_input(keystroke=False)
+                    return ""
+
+    def has_pending_input(self) -> bool:
+        """Return whether the next key is available without waiting, so that drawing can be put off."""
+        if not self._pending_keys and (key := self._get_key()):
+            self._pending_keys.appendleft(key)
+        return bool(self._pending_keys)
+
+    def close(self) -> None:
+        self._screen.write(DISABLE_BRACKETED_PASTE)
+
+    def _get_key(self) -> str:
+        """Return the next key (or pasted text) if available right away, and an empty string otherwise."""
+        started = time.perf_counter()
+        key = self._screen.get_key()
+        if key == ESCAPE:
+            matched, keys = self._read_expected_keys(PASTE_START[1:])
+            if matched:
+                key = self._read_paste()
+            else:
+                # an escape key on its own, which was followed by other keys
+                self._pending_keys.extend(keys)
+        if key:
+            performance.add("read", started)
         return key
 
+    def _read_expected_keys(self, expected_keys: str) -> tuple[bool, list[str]]:
+        """Read keys as long as they match the expected ones; return whether all matched, and the keys read."""
+        keys: list[str] = []
+        for expected_key in expected_keys:
+            key = self._screen.get_key()
+            if key:
+                keys.append(key)
+            if key != expected_key:
+                return False, keys
+        return True, keys
+
+    def _read_paste(self) -> PastedText:
+        characters: list[str] = []
+        # the screen returns None once it timed out waiting for the end of the paste
+        while (character := self._screen.get_character(self._PASTE_TIMEOUT)) is not None:
+            if character == ESCAPE:
+                matched, keys = self._read_expected_keys(PASTE_END[1:])
+                if matched:
+                    break
+                characters.append(character)
+                characters.extend(keys)
+            else:
+                characters.append(character)
+        text = "".join(characters).replace("\r\n", "\n").replace("\r", "\n")
+        return PastedText(text)
+
     def resize(self) -> None:
-        curses.update_lines_cols()
+        lines, columns = self._screen.size
         self._window.erase()
 
-        # pylint: disable=no-member
-        self._document_view.set_size(curses.LINES - 2, curses.COLS)
-        self._status_line_view.move(curses.LINES - 2, 0)
-        self._command_line_view.move(curses.LINES - 1, 0)
+        self._document_view.set_size(lines - 2, columns)
+        self._status_line_view.move(lines - 2, 0)
+        self._command_line_view.move(lines - 1, 0)
 
     @property
-    def document(self) -> list[str] | None:
+    def document(self) -> Document | None:
         return self._document_view.document
 
     @document.setter
-    def document(self, lines: list[str]) -> None:
-        self._document_view.document = lines
+    def document(self, document: Document) -> None:
+        self._document_view.document = document
 
     @property
-    def highlights(self) -> list[list[Highlight]] | None:
-        return self._document_view.highlights
+    def highlighters(self) -> list[SyntaxHighlighter]:
+        return self._document_view.highlighters
 
-    @highlights.setter
-    def highlights(self, highlights: list[list[Highlight]]) -> None:
-        self._document_view.highlights = highlights
+    @highlighters.setter
+    def highlighters(self, highlighters: list[SyntaxHighlighter]) -> None:
+        self._document_view.highlighters = highlighters
 
     @property
     def cursor(self) -> tuple[int, int]:
@@ -89,6 +186,14 @@ class MainView:
     def status_color(self, status_color: colors.Color) -> None:
         self._status_line_view.status_color = status_color
 
+    @property
+    def message(self) -> str:
+        return self._status_line_view.message
+
+    @message.setter
+    def message(self, message: str) -> None:
+        self._status_line_view.message = message
+
     @property
     def command(self) -> str:
         return self._command_line_view.command
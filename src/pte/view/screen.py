@@ -0,0 +1,73 @@
+from typing_extensions import Protocol
+
+from pte import colors
+
+
+class Window(Protocol):
+    """The part of a curses window the views draw with; curses windows implement it as they are."""
+
+    def getmaxyx(self) -> tuple[int, int]:
+        ...
+
+    def addstr(self, y: int, x: int, text: str, attributes: int = 0, /) -> None:
+        ...
+
+    def move(self, y: int, x: int, /) -> None:
+        ...
+
+    def clrtoeol(self) -> None:
+        ...
+
+    def erase(self) -> None:
+        ...
+
+    def noutrefresh(self) -> None:
+        ...
+
+    def resize(self, height: int, width: int, /) -> None:
+        ...
+
+    def mvwin(self, y: int, x: int, /) -> None:
+        ...
+
+
+class Screen(Protocol):
+    """A terminal screen, which provides the windows to draw in and the keys typed."""
+
+    @property
+    def window(self) -> Window:
+        """The window covering the whole screen."""
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """The number of lines and columns of the screen."""
+
+    def create_window(self, height: int, width: int, y: int, x: int) -> Window:
+        """Return a window for a part of the screen, sharing its content with the screen window."""
+
+    def get_attribute(self, color: colors.Color, *, reverse: bool = False, bold: bool = False) -> int:
+        """Return the attributes to draw text in the given color with."""
+
+    def set_cursor(self, y: int, x: int) -> None:
+        ...
+
+    def show_cursor(self, visible: bool) -> None:
+        ...
+
+    def update(self) -> None:
+        """Show what the windows refreshed since the last update contain."""
+
+    def write(self, sequence: str) -> None:
+        """Send a control sequence to the terminal."""
+
+    def get_key(self) -> str:
+        """Return the next key if available right away, and an empty string otherwise.
+
+        Returns "KEY_RESIZE" once the screen was resized.
+        """
+
+    def get_character(self, timeout: int) -> str | None:
+        """Return the next character, waiting at most timeout milliseconds for it; None on timeout."""
+
+    def fileno(self) -> int | None:
+        """Return a file descriptor which becomes readable when keys are available, if any."""
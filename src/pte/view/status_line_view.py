@@ -1,22 +1,28 @@
-import curses
-
 from pte import colors
 
+from .screen import Screen, Window
+
 
 class StatusLineView:
-    def __init__(self, window: curses.window):
+    def __init__(self, screen: Screen, window: Window):
+        self._screen = screen
         self._window = window
         self.status = ""
         self.status_color: colors.Color = colors.DEFAULT
+        self.message = ""
 
     def draw(self, *, bottom_line_right: str = "") -> None:
         self._window.erase()
+        status = f" {self.status} "
         self._window.addstr(
             0,
             0,
-            f" {self.status} ",
-            curses.color_pair(self.status_color) ^ curses.A_REVERSE ^ curses.A_BOLD,
+            status,
+            self._screen.get_attribute(self.status_color, reverse=True, bold=True),
         )
+        message_width = self.window_width - 2 - len(status) - len(bottom_line_right)
+        if self.message and message_width > 0:
+            self._window.addstr(0, len(status) + 1, self.message[:message_width])
         self._window.addstr(
             0,
             self.window_width - 1 - len(bottom_line_right),
@@ -0,0 +1,255 @@
+from collections import deque
+import curses
+import re
+from typing import NamedTuple
+
+from pte import colors, wakeup
+
+from .screen import Window
+
+
+# a character and its attributes
+Cell = tuple[str, int]
+_BLANK: Cell = (" ", 0)
+_TAB_SIZE = 8
+_CONTROL_CHARACTER = re.compile("[\x00-\x1f\x7f]")
+
+
+class FrameStatistics(NamedTuple):
+    """What an update of the screen changed: the number of cells, and the bytes a terminal would receive for them."""
+
+    cells: int
+    bytes: int
+
+
+class VirtualWindow:
+    """A window of a virtual screen, whose content is kept in the cells of the screen, like a curses subwindow."""
+
+    def __init__(self, screen: "VirtualScreen", height: int, width: int, y: int, x: int) -> None:
+        self._screen = screen
+        self._size = (height, width)
+        self._origin = (y, x)
+        self._cursor = (0, 0)
+
+    def getmaxyx(self) -> tuple[int, int]:
+        return self._size
+
+    def addstr(self, y: int, x: int, text: str, attributes: int = 0, /) -> None:
+        """Write text from the given position on, wrapping at the end of lines, as curses does.
+
+        Like curses, raise curses.error if the text reaches the end of the window, after writing it.
+        """
+        height, width = self._size
+        self.move(y, x)
+        for character in _expand(text, x):
+            if character == "\n":
+                self.clrtoeol()
+                y, x = y + 1, 0
+            else:
+                self._screen.set_cell(self._origin[0] + y, self._origin[1] + x, (character, attributes))
+                y, x = (y, x + 1) if x + 1 < width else (y + 1, 0)
+            if y >= height:
+                self._cursor = (height - 1, width - 1)
+                raise curses.error("addstr() returned ERR")
+            self._cursor = (y, x)
+
+    def move(self, y: int, x: int, /) -> None:
+        height, width = self._size
+        if not (0 <= y < height and 0 <= x < width):
+            raise curses.error("wmove() returned ERR")
+        self._cursor = (y, x)
+
+    def clrtoeol(self) -> None:
+        y, x = self._cursor
+        self._fill(y, y + 1, x)
+
+    def erase(self) -> None:
+        self._fill(0, self._size[0], 0)
+        self._cursor = (0, 0)
+
+    def noutrefresh(self) -> None:
+        height, width = self._size
+        self._screen.refresh_area(self._origin[0], self._origin[1], height, width)
+
+    def resize(self, height: int, width: int, /) -> None:
+        self._size = (height, width)
+        self._cursor = (min(self._cursor[0], height - 1), min(self._cursor[1], width - 1))
+
+    def mvwin(self, y: int, x: int, /) -> None:
+        self._origin = (y, x)
+
+    def _fill(self, first_line: int, end_line: int, column: int) -> None:
+        for y in range(first_line, end_line):
+            for x in range(column, self._size[1]):
+                self._screen.set_cell(self._origin[0] + y, self._origin[1] + x, _BLANK)
+
+
+class VirtualScreen:
+    """A screen kept in memory, so that the editor can run without a terminal.
+
+    Like curses, the screen keeps the content of its windows apart from what was shown by the last
+    update, and each update shows only the cells that changed. The statistics of each update are
+    recorded in frames; the bytes are those curses would write for the changed cells, estimated
+    from the cursor movement and attribute changes needed.
+
+    The keys typed are fed to the screen in advance. Each input passed to feed() is delivered at
+    once, but only after the screen was updated since the previous one, as if typed while the
+    editor is idle. Once all input is read and shown, reading more raises EOFError.
+    """
+
+    def __init__(self, lines: int = 24, columns: int = 80) -> None:
+        self._size = (lines, columns)
+        # the content of the windows, and the content shown
+        self._cells = [[_BLANK] * columns for _ in range(lines)]
+        self._shown = [[_BLANK] * columns for _ in range(lines)]
+        # the content of the refreshed windows, which the next update shows
+        self._refreshed = [[_BLANK] * columns for _ in range(lines)]
+        self._window = VirtualWindow(self, lines, columns, 0, 0)
+
+        self._cursor = (0, 0)
+        self._cursor_visible = True
+        # the state of the terminal after the last update
+        self._shown_cursor = (0, 0)
+        self._shown_cursor_visible = True
+        self._written_bytes = 0
+        self.frames: list[FrameStatistics] = []
+
+        self._inputs: deque[str] = deque()
+        self._keys: deque[str] = deque()
+        # whether the screen was updated since the last input was delivered
+        self._updated = False
+        self._resize_pending = False
+
+    def feed(self, *inputs: str) -> None:
+        """Add input, each string of which is delivered at once in a later frame."""
+        self._inputs.extend(text for text in inputs if text)
+
+    def resize(self, lines: int, columns: int) -> None:
+        """Change the size of the screen, as a terminal resized by the user."""
+        self._size = (lines, columns)
+        self._cells = [[_BLANK] * columns for _ in range(lines)]
+        self._shown = [[_BLANK] * columns for _ in range(lines)]
+        self._refreshed = [[_BLANK] * columns for _ in range(lines)]
+        self._window.resize(lines, columns)
+        self._resize_pending = True
+        wakeup.notify()
+
+    def get_lines(self) -> list[str]:
+        """Return the text shown on the screen, line by line."""
+        return ["".join(character for character, _ in line).rstrip() for line in self._shown]
+
+    @property
+    def window(self) -> Window:
+        return self._window
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self._size
+
+    def create_window(self, height: int, width: int, y: int, x: int) -> Window:
+        return VirtualWindow(self, height, width, y, x)
+
+    def get_attribute(self, color: colors.Color, *, reverse: bool = False, bold: bool = False) -> int:
+        return color << 8 | (curses.A_REVERSE if reverse else 0) | (curses.A_BOLD if bold else 0)
+
+    def set_cursor(self, y: int, x: int) -> None:
+        self._cursor = (y, x)
+
+    def show_cursor(self, visible: bool) -> None:
+        self._cursor_visible = visible
+
+    def update(self) -> None:
+        cells = 0
+        written_bytes = self._written_bytes
+        cursor = self._shown_cursor
+        attributes = 0
+        for y, (line, shown_line) in enumerate(zip(self._refreshed, self._shown)):
+            if line == shown_line:
+                continue
+            for x, cell in enumerate(line):
+                if cell == shown_line[x]:
+                    continue
+                if cursor != (y, x):
+                    written_bytes += _get_move_size(y, x)
+                if cell[1] != attributes:
+                    attributes = cell[1]
+                    written_bytes += _get_attribute_size(attributes)
+                written_bytes += len(cell[0].encode(errors="surrogateescape"))
+                shown_line[x] = cell
+                cells += 1
+                cursor = (y, x + 1)
+        if attributes != 0:
+            written_bytes += _get_attribute_size(0)
+
+        if self._cursor_visible != self._shown_cursor_visible:
+            written_bytes += len("\x1b[?25h")
+        if self._cursor != cursor:
+            written_bytes += _get_move_size(*self._cursor)
+        self._shown_cursor = self._cursor
+        self._shown_cursor_visible = self._cursor_visible
+
+        self.frames.append(FrameStatistics(cells, written_bytes))
+        self._written_bytes = 0
+        self._updated = True
+
+    def write(self, sequence: str) -> None:
+        self._written_bytes += len(sequence.encode())
+
+    def get_key(self) -> str:
+        if self._resize_pending:
+            self._resize_pending = False
+            return "KEY_RESIZE"
+        if not self._keys and self._inputs and self._updated:
+            self._keys.extend(self._inputs.popleft())
+            self._updated = False
+        if self._keys:
+            return self._keys.popleft()
+        if not self._inputs and self._updated:
+            raise EOFError("all input was read")
+        return ""
+
+    def get_character(self, timeout: int) -> str | None:
+        # all keys of an input are available at once, so there is nothing to wait for
+        return self._keys.popleft() if self._keys else None
+
+    def fileno(self) -> int | None:
+        return None
+
+    def set_cell(self, y: int, x: int, cell: Cell) -> None:
+        if 0 <= y < self._size[0] and 0 <= x < self._size[1]:
+            self._cells[y][x] = cell
+
+    def refresh_area(self, y: int, x: int, height: int, width: int) -> None:
+        for line, refreshed_line in zip(self._cells[y : y + height], self._refreshed[y : y + height]):
+            refreshed_line[x : x + width] = line[x : x + width]
+
+
+def _expand(text: str, column: int) -> str:
+    """Replace tabs and control characters by what curses shows for them."""
+    if not _CONTROL_CHARACTER.search(text):
+        return text
+    characters = []
+    for character in text:
+        if character == "\t":
+            character = " " * (_TAB_SIZE - column % _TAB_SIZE)
+        elif character != "\n" and _CONTROL_CHARACTER.match(character):
+            character = f"^{chr((ord(character) + 64) % 128)}"
+        column = 0 if character == "\n" else column + len(character)
+        characters.append(character)
+    return "".join(characters)
+
+
+def _get_move_size(y: int, x: int) -> int:
+    return len(f"\x1b[{y + 1};{x + 1}H")
+
+
+def _get_attribute_size(attributes: int) -> int:
+    """Return the length of the escape sequence selecting the given attributes."""
+    sequence = "\x1b[0"
+    if attributes & curses.A_REVERSE:
+        sequence += ";7"
+    if attributes & curses.A_BOLD:
+        sequence += ";1"
+    if color := (attributes & curses.A_COLOR) >> 8:
+        sequence += f";38;5;{color}"
+    return len(sequence) + 1
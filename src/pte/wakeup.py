@@ -0,0 +1,32 @@
+"""A self-pipe, used to wake up the main loop while it waits for input.
+
+Background work calls notify() when it has results to pick up. The main loop waits until the read
+end (fileno()) becomes readable, alongside stdin, and then calls clear().
+"""
+
+import os
+
+
+_read_fd, _write_fd = os.pipe()
+os.set_blocking(_read_fd, False)
+os.set_blocking(_write_fd, False)
+
+
+def fileno() -> int:
+    return _read_fd
+
+
+def notify() -> None:
+    try:
+        os.write(_write_fd, b"\0")
+    except BlockingIOError:
+        # the pipe is full, so the main loop will wake up anyway
+        pass
+
+
+def clear() -> None:
+    try:
+        while os.read(_read_fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
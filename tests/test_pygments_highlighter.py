@@ -0,0 +1,86 @@
+import random
+import unittest
+
+from pte.documents import Document
+from pte.highlight import PackedHighlights, unpack
+from pte.syntax_highlighting import PygmentsHighlighter
+
+
+# per lexer, the initial lines and fragments likely to produce tokens spanning lines, or ending at line breaks
+_SAMPLES = {
+    "python": (
+        ["import os", "", "def f(x):", "    return x"],
+        ['"""', "'", "def ", "import os", "#", " ", "\t", "\\", "(", ")", "x", "\n", "\n\n"],
+    ),
+    "js": (
+        ["var a = 1;", "", "function f(x) {", "    return x;", "}"],
+        ["/*", "*/", "//", '"', "'", "`", "${", "/", "{", "}", "var ", " ", "\\", "x", "\n", "\n\n"],
+    ),
+    "css": (
+        ["body {", "    color: red;", "}", "", "a { margin: 0 }"],
+        ["/*", "*/", '"', "'", "{", "}", ":", ";", "@media ", "url(", ")", " ", "\\", "x", "\n", "\n\n"],
+    ),
+}
+
+
+class IncrementalLexingTest(unittest.TestCase):
+    """Incremental lexing after edits must give the same highlights as lexing the document anew."""
+
+    def assert_matches_full_lexing(self, document: Document, highlighter: PygmentsHighlighter, lexer: str) -> None:
+        end = document.number_of_lines()
+        highlighter.prepare(0, end)
+        fresh = PygmentsHighlighter(document.snapshot(), lexer, background=False)
+        fresh.prepare(0, end)
+        for line in range(end):
+            self.assertEqual(
+                _get_colors(highlighter.get_highlights(line)),
+                _get_colors(fresh.get_highlights(line)),
+                f"line {line} of {document.get_lines(0, end)!r}",
+            )
+
+    def create(self, lines: list[str], lexer: str = "python") -> tuple[Document, PygmentsHighlighter]:
+        document = Document(lines)
+        highlighter = PygmentsHighlighter(document, lexer, background=False)
+        document.subscribe_changes(highlighter.update)
+        highlighter.prepare(0, document.number_of_lines())
+        return document, highlighter
+
+    def test_token_ending_at_changed_line(self) -> None:
+        # the whitespace after def ends at the start of the last line, until that line is indented
+        document, highlighter = self.create(["def ", "", "import os"])
+        document.insert(2, 0, " ")
+        self.assert_matches_full_lexing(document, highlighter, "python")
+
+    def test_comment_closed_in_later_line(self) -> None:
+        # the comment opened in the first line extends over the following lines once it is closed
+        document, highlighter = self.create(["var a;", "var b;", "var c;", "var d;"], "js")
+        document.insert(0, 0, "/* ")
+        highlighter.prepare(0, document.number_of_lines())
+        document.insert(2, 6, " */")
+        self.assert_matches_full_lexing(document, highlighter, "js")
+
+    def test_random_edits(self) -> None:
+        for lexer, (lines, fragments) in _SAMPLES.items():
+            with self.subTest(lexer=lexer):
+                generator = random.Random(0)
+                for _ in range(100):
+                    document, highlighter = self.create(lines, lexer)
+                    for _ in range(20):
+                        line = generator.randrange(document.number_of_lines())
+                        column = generator.randint(0, document.get_line_length(line))
+                        if generator.random() < 0.7:
+                            document.insert(line, column, generator.choice(fragments))
+                        elif column < document.get_line_length(line):
+                            document.delete_in_line(line, column, generator.randint(1, 3))
+                        else:
+                            document.join_lines(line)
+                        self.assert_matches_full_lexing(document, highlighter, lexer)
+
+
+def _get_colors(highlights: PackedHighlights) -> dict[int, int]:
+    # tokens may be split differently, e.g. at the end of a range lexed, without changing the colors
+    return {column: color for start, length, color in unpack(highlights) for column in range(start, start + length)}
+
+
+if __name__ == "__main__":
+    unittest.main()